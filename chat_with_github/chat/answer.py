@@ -0,0 +1,82 @@
+"""Stream answers from Ollama, continuing past the per-request token cap.
+
+Retrieval still goes through the repository's embedchain App, but generation
+talks to Ollama directly so tokens can be rendered as they arrive. When a
+response stops because it hit `MAX_TOKENS`, a continuation request is sent
+so long answers are not silently truncated.
+"""
+
+import asyncio
+from typing import AsyncIterator, List
+
+from ollama import AsyncClient
+
+from chat.registry import OLLAMA_BASE_URL
+
+MODEL = "llama3:instruct"
+
+# Tokens generated per request, and how many times an answer may be continued.
+MAX_TOKENS = 250
+MAX_CONTINUATIONS = 4
+
+# Chunks retrieved from the vector store for every question.
+NUM_DOCUMENTS = 5
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant answering questions about a code repository. "
+    "Use the context retrieved from the repository to answer. If the context "
+    "is not enough to answer, say so."
+)
+
+CONTINUE_PROMPT = (
+    "Continue your previous answer exactly where it stopped, "
+    "without repeating anything."
+)
+
+ollama_client = AsyncClient(host=OLLAMA_BASE_URL)
+
+
+async def retrieve(app, repo: str, question: str) -> List[str]:
+    """The chunks of the repository most relevant to the question."""
+    results = await asyncio.to_thread(
+        app.search, question, num_documents=NUM_DOCUMENTS, where={"repo": repo}
+    )
+    return [
+        f"{result['metadata'].get('url', '')}\n{result['context']}"
+        for result in results
+    ]
+
+
+def build_messages(contexts: List[str], history: List[dict], question: str):
+    context = "\n\n---\n\n".join(contexts)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"},
+    ]
+
+
+async def stream_answer(messages: List[dict]) -> AsyncIterator[str]:
+    """Yield the answer as it is generated, continuing it if it was cut off."""
+    messages = list(messages)
+    for _ in range(MAX_CONTINUATIONS + 1):
+        parts, done_reason = [], None
+        async for chunk in await ollama_client.chat(
+            model=MODEL,
+            messages=messages,
+            stream=True,
+            options={"num_predict": MAX_TOKENS, "temperature": 0.5},
+        ):
+            content = chunk["message"]["content"]
+            if content:
+                parts.append(content)
+                yield content
+            if chunk["done"]:
+                done_reason = chunk.get("done_reason")
+
+        if done_reason != "length":
+            return
+        messages += [
+            {"role": "assistant", "content": "".join(parts)},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
@@ -1,14 +1,24 @@
 import reflex as rx
 from typing import List
 from dataclasses import dataclass
-import tempfile
 import asyncio
 import os
-from embedchain import App
-from embedchain.loaders.github import GithubLoader
+import time
+
+from chat.answer import build_messages, retrieve, stream_answer
+from chat.ingest import GithubClient, IngestManifest, sync_repo
+from chat.local_repo import ingest_local, is_local_path, repo_key
+from chat.registry import DB_DIR, app_registry
+from chat.symbols import answer_from_symbols
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 
+# Previous question/answer pairs sent along with a new question.
+HISTORY_TURNS = 3
+
+# Seconds between two UI updates while an answer is streamed.
+FLUSH_INTERVAL = 0.05
+
 # Styles from the reference code
 message_style = dict(
     display="inline-block",
@@ -52,66 +62,81 @@ class State(rx.State):
     chats: List[List[QA]] = [[]]
     current_chat: int = 0
     processing: bool = False
-    db_path: str = tempfile.mkdtemp()
     upload_status: str = ""
     is_loading: bool = False
     repo: str = ""
+    # Clone the repository and read it locally instead of using the GitHub API.
+    use_clone: bool = False
 
-    _app_instance = None
-
-    def get_app(self):
-        """Get or create the app instance."""
-        if State._app_instance is None:
-            State._app_instance = App.from_config(
-                config={
-                    "llm": {
-                        "provider": "ollama",
-                        "config": {
-                            "model": "llama3:instruct",
-                            "max_tokens": 250,
-                            "temperature": 0.5,
-                            "stream": True,
-                            "base_url": "http://localhost:11434",
-                        },
-                    },
-                    "vectordb": {"provider": "chroma", "config": {"dir": self.db_path}},
-                    "embedder": {
-                        "provider": "ollama",
-                        "config": {
-                            "model": "llama3:instruct",
-                            "base_url": "http://localhost:11434",
-                        },
-                    },
-                }
-            )
-        return State._app_instance
+    # The repository questions are asked about, set once it has been processed.
+    active_repo: str = ""
+
+    def get_app(self, repo: str):
+        """Get the app of a repository from the process-wide registry."""
+        return app_registry.get(repo)
 
-    def get_loader(self):
-        return GithubLoader(config={"token": GITHUB_TOKEN})
+    def get_manifest(self):
+        os.makedirs(DB_DIR, exist_ok=True)
+        return IngestManifest(os.path.join(DB_DIR, "ingest_manifest.db"))
 
     @rx.event(background=True)
     async def process_question(self, form_data: dict):
-        """Process a question and update the chat."""
+        """Process a question and stream the answer into the chat."""
         if self.processing or not form_data.get("question"):
             return
 
         question = form_data["question"]
+        repo = self.active_repo
 
         async with self:
             self.processing = True
+            history = [
+                message
+                for qa in self.chats[self.current_chat][-HISTORY_TURNS:]
+                for message in (
+                    {"role": "user", "content": qa.question},
+                    {"role": "assistant", "content": qa.answer},
+                )
+            ]
             self.chats[self.current_chat].append(QA(question=question, answer=""))
-            yield
-            await asyncio.sleep(1)
 
-        app = self.get_app()
-        answer = app.chat(question)
+        try:
+            if not repo:
+                await self._append_answer("Process a repository first.")
+                return
+
+            app = await asyncio.to_thread(self.get_app, repo)
+            # Exact symbol lookups are answered from the index, without vector search.
+            answer = await asyncio.to_thread(
+                answer_from_symbols, app, self.get_manifest(), repo, question
+            )
+            if answer is not None:
+                await self._append_answer(answer)
+                return
+
+            contexts = await retrieve(app, repo, question)
+            buffer, last_flush = "", time.monotonic()
+            async for delta in stream_answer(
+                build_messages(contexts, history, question)
+            ):
+                buffer += delta
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    await self._append_answer(buffer)
+                    buffer, last_flush = "", time.monotonic()
+            await self._append_answer(buffer)
+        except Exception as e:
+            await self._append_answer(f"\n\nError: {str(e)}")
+        finally:
+            async with self:
+                self.processing = False
 
+    async def _append_answer(self, text: str):
+        """Append text to the answer being generated."""
+        if not text:
+            return
         async with self:
-            self.chats[self.current_chat][-1].answer = answer
-            self.processing = False
+            self.chats[self.current_chat][-1].answer += text
             self.chats = self.chats
-            yield
-            await asyncio.sleep(1)
 
     @rx.event(background=True)
     async def handle_repo_input(self):
@@ -125,12 +150,29 @@ class State(rx.State):
             await asyncio.sleep(1)
 
         try:
-            app = self.get_app()
-            loader = self.get_loader()
-            app.add(f"repo:{self.repo} type:repo", data_type="github", loader=loader)
+            repo = repo_key(self.repo)
+            app = await asyncio.to_thread(self.get_app, repo)
+            if self.use_clone or is_local_path(self.repo):
+                progress = ingest_local(app, self.get_manifest(), self.repo)
+            else:
+                progress = sync_repo(
+                    app, GithubClient(GITHUB_TOKEN), self.get_manifest(), self.repo
+                )
+            updated = False
+            # Run every step in a worker thread so the event loop stays free.
+            while step := await asyncio.to_thread(next, progress, None):
+                updated = True
+                async with self:
+                    self.upload_status = (
+                        f"Indexing {step.path} ({step.done}/{step.total})"
+                    )
 
             async with self:
-                self.upload_status = f"Added {self.repo} to knowledge base!"
+                self.active_repo = repo
+                if updated:
+                    self.upload_status = f"Added {self.repo} to knowledge base!"
+                else:
+                    self.upload_status = f"{self.repo} is already up to date."
                 yield
         except Exception as e:
             async with self:
@@ -145,6 +187,10 @@ class State(rx.State):
         """Update the repo"""
         self.repo = repo
 
+    def set_use_clone(self, use_clone: bool):
+        """Toggle reading the repository from a local clone."""
+        self.use_clone = use_clone
+
 
 def message(qa: QA) -> rx.Component:
     """A single question/answer message."""
@@ -333,6 +379,14 @@ def index():
                 border_bottom=f"0.75px solid {rx.color('gray', 4)}",
             ),
             rx.divider(height="0.5em", opacity="0"),
+            rx.checkbox(
+                "Clone locally (or enter a local path)",
+                checked=State.use_clone,
+                on_change=State.set_use_clone,
+                size="1",
+                width="100%",
+            ),
+            rx.divider(height="0.5em", opacity="0"),
             rx.button(
                 "Process",
                 on_click=State.handle_repo_input,
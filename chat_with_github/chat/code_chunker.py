@@ -0,0 +1,234 @@
+"""Split source files on function and class boundaries.
+
+Python files are parsed with the standard `ast` module. Other languages use
+tree-sitter when `tree_sitter_languages` is installed, and everything else
+falls back to plain line-based chunks. Besides the chunks, every definition
+found is returned as a symbol so it can be looked up by name.
+"""
+
+import ast
+import os
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+try:
+    from tree_sitter_languages import get_parser
+except ImportError:
+    get_parser = None
+
+CHUNK_SIZE = 2000
+
+TREE_SITTER_LANGUAGES = {
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "tsx",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".rb": "ruby",
+    ".c": "c",
+    ".h": "c",
+    ".cpp": "cpp",
+    ".hpp": "cpp",
+    ".cs": "c_sharp",
+    ".php": "php",
+}
+
+# tree-sitter node types that define a named symbol, and the kind we record.
+TREE_SITTER_DEFINITIONS = {
+    "function_declaration": "function",
+    "function_definition": "function",
+    "function_item": "function",
+    "method_definition": "method",
+    "method_declaration": "method",
+    "method": "method",
+    "class_declaration": "class",
+    "class_definition": "class",
+    "class": "class",
+    "interface_declaration": "interface",
+    "struct_item": "struct",
+    "enum_item": "enum",
+    "trait_item": "trait",
+    "impl_item": "impl",
+    "type_declaration": "type",
+}
+
+
+@dataclass
+class Symbol:
+    """A named definition in a source file."""
+
+    name: str
+    kind: str
+    line: int
+    chunk: int = 0
+
+
+@dataclass
+class CodeChunk:
+    """A piece of a source file, starting at `start_line` (1-based)."""
+
+    text: str
+    start_line: int
+    symbols: List[str] = field(default_factory=list)
+
+
+def split_text(text: str, size: int = CHUNK_SIZE) -> List[str]:
+    """Split text into chunks of about `size` characters on line boundaries."""
+    chunks, current, length = [], [], 0
+    for line in text.splitlines(keepends=True):
+        if current and length + len(line) > size:
+            chunks.append("".join(current))
+            current, length = [], 0
+        current.append(line)
+        length += len(line)
+    if current:
+        chunks.append("".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _line_chunks(lines: List[str], start: int, end: int) -> List[CodeChunk]:
+    """Chunk lines[start:end], splitting it further if it is too long."""
+    text = "".join(lines[start:end])
+    if len(text) <= CHUNK_SIZE:
+        return [CodeChunk(text=text, start_line=start + 1)] if text.strip() else []
+    chunks, line = [], start + 1
+    for part in split_text(text):
+        chunks.append(CodeChunk(text=part, start_line=line))
+        line += part.count("\n")
+    return chunks
+
+
+def _chunk_spans(lines: List[str], spans: List[Tuple[int, int]]) -> List[CodeChunk]:
+    """Chunk a file given the (start, end) line spans of its definitions.
+
+    The code between definitions (imports, constants, ...) gets its own chunks.
+    """
+    chunks, position = [], 0
+    for start, end in sorted(spans):
+        if start < position:
+            continue
+        chunks.extend(_line_chunks(lines, position, start))
+        chunks.extend(_line_chunks(lines, start, end))
+        position = end
+    chunks.extend(_line_chunks(lines, position, len(lines)))
+    return chunks
+
+
+def _python_spans(tree: ast.Module) -> List[Tuple[int, int]]:
+    spans = []
+    definitions = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    for node in tree.body:
+        if not isinstance(node, definitions):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+        methods = [n for n in node.body if isinstance(n, definitions)]
+        if isinstance(node, ast.ClassDef) and methods:
+            # Keep the class header with its attributes, then one chunk per method.
+            first = min(
+                [methods[0].lineno] + [d.lineno for d in methods[0].decorator_list]
+            )
+            spans.append((start, first - 1))
+            for method in methods:
+                method_start = min(
+                    [method.lineno] + [d.lineno for d in method.decorator_list]
+                )
+                spans.append((method_start - 1, method.end_lineno))
+        else:
+            spans.append((start, node.end_lineno))
+    return spans
+
+
+def _python_symbols(tree: ast.Module) -> List[Symbol]:
+    symbols = []
+
+    def visit(node: ast.AST, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                if isinstance(child, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if prefix else "function"
+                symbols.append(Symbol(name=name, kind=kind, line=child.lineno))
+                visit(child, f"{name}.")
+
+    visit(tree, "")
+    return symbols
+
+
+def _tree_sitter_definitions(source: bytes, language: str):
+    """The (kind, name, start_line, end_line, top_level) of every definition."""
+    tree = get_parser(language).parse(source)
+    definitions = []
+
+    def visit(node, depth: int) -> None:
+        for child in node.children:
+            kind = TREE_SITTER_DEFINITIONS.get(child.type)
+            if kind:
+                name_node = child.child_by_field_name(
+                    "name"
+                ) or child.child_by_field_name("type")
+                if name_node is not None:
+                    definitions.append(
+                        (
+                            kind,
+                            name_node.text.decode("utf-8", "replace"),
+                            child.start_point[0],
+                            child.end_point[0] + 1,
+                            depth == 0,
+                        )
+                    )
+            visit(child, depth + (1 if kind else 0))
+
+    visit(tree.root_node, 0)
+    return definitions
+
+
+def _assign_chunks(chunks: List[CodeChunk], symbols: List[Symbol]) -> None:
+    """Point every symbol at the chunk that contains its definition."""
+    for symbol in symbols:
+        for index, chunk in enumerate(chunks):
+            if chunk.start_line <= symbol.line:
+                symbol.chunk = index
+            else:
+                break
+        if chunks:
+            chunks[symbol.chunk].symbols.append(symbol.name)
+
+
+def chunk_code(path: str, text: str) -> Tuple[List[CodeChunk], List[Symbol]]:
+    """Split a source file into chunks and collect the symbols it defines."""
+    lines = text.splitlines(keepends=True)
+    extension = os.path.splitext(path)[1].lower()
+    chunks, symbols = None, []
+
+    if extension == ".py":
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            chunks = _chunk_spans(lines, _python_spans(tree))
+            symbols = _python_symbols(tree)
+    elif get_parser is not None and extension in TREE_SITTER_LANGUAGES:
+        try:
+            definitions = _tree_sitter_definitions(
+                text.encode("utf-8"), TREE_SITTER_LANGUAGES[extension]
+            )
+        except Exception:
+            definitions = None
+        if definitions is not None:
+            chunks = _chunk_spans(
+                lines, [(start, end) for _, _, start, end, top in definitions if top]
+            )
+            symbols = [
+                Symbol(name=name, kind=kind, line=start + 1)
+                for kind, name, start, _, _ in definitions
+            ]
+
+    if chunks is None:
+        chunks = _line_chunks(lines, 0, len(lines))
+    _assign_chunks(chunks, symbols)
+    return chunks, symbols
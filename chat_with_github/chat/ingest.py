@@ -0,0 +1,356 @@
+"""Incremental ingestion of GitHub repositories into the vector store.
+
+The commit SHA of every ingested repository is recorded in a small SQLite
+manifest next to the vector store. When a repository is added again, only the
+files changed since that commit are fetched (through the compare API) and
+re-embedded, and the vectors of removed files are deleted. The manifest also
+holds the symbol index (name -> file:line) built while chunking the files.
+"""
+
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+import requests
+
+from chat.code_chunker import CodeChunk, Symbol, chunk_code
+
+# Point this at a local stand-in to run without hitting api.github.com.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+# Files larger than this are skipped, they are almost never useful context.
+MAX_FILE_BYTES = 200_000
+
+# The compare API lists at most this many changed files; with more, the
+# repository is resynced in full.
+COMPARE_MAX_FILES = 300
+
+BINARY_EXTENSIONS = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".ico",
+    ".svg",
+    ".webp",
+    ".pdf",
+    ".zip",
+    ".gz",
+    ".tar",
+    ".whl",
+    ".jar",
+    ".exe",
+    ".dll",
+    ".so",
+    ".dylib",
+    ".woff",
+    ".woff2",
+    ".ttf",
+    ".eot",
+    ".mp3",
+    ".mp4",
+    ".mov",
+    ".pyc",
+    ".lock",
+    ".bin",
+    ".db",
+    ".sqlite3",
+}
+
+
+@dataclass
+class ChangedFile:
+    """A file that changed between two commits."""
+
+    path: str
+    status: str
+    previous_path: str = ""
+
+
+@dataclass
+class SymbolLocation:
+    """Where a symbol is defined."""
+
+    name: str
+    kind: str
+    path: str
+    line: int
+    chunk_id: str
+
+
+@dataclass
+class IngestProgress:
+    """Progress of a repository ingestion."""
+
+    done: int
+    total: int
+    path: str
+    sha: str
+
+
+class GithubClient:
+    """The few GitHub REST endpoints needed for ingestion."""
+
+    def __init__(self, token: Optional[str] = None, base_url: str = GITHUB_API_URL):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def _get(self, path: str, **kwargs) -> requests.Response:
+        response = self.session.get(f"{self.base_url}{path}", timeout=30, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def head_sha(self, repo: str) -> str:
+        """The SHA of the latest commit on the default branch."""
+        branch = self._get(f"/repos/{repo}").json()["default_branch"]
+        return self._get(f"/repos/{repo}/commits/{branch}").json()["sha"]
+
+    def _walk_tree(self, repo: str, sha: str, prefix: str = "") -> List[dict]:
+        """The items of a tree and its subtrees, fetched one level at a time."""
+        items = []
+        for item in self._get(f"/repos/{repo}/git/trees/{sha}").json()["tree"]:
+            path = f"{prefix}{item['path']}"
+            if item["type"] == "tree":
+                items.extend(self._walk_tree(repo, item["sha"], f"{path}/"))
+            else:
+                items.append({**item, "path": path})
+        return items
+
+    def list_files(self, repo: str, sha: str) -> List[str]:
+        """All blob paths of the tree at the given commit."""
+        tree = self._get(
+            f"/repos/{repo}/git/trees/{sha}", params={"recursive": "1"}
+        ).json()
+        # Large trees are cut off in the recursive listing.
+        items = self._walk_tree(repo, sha) if tree.get("truncated") else tree["tree"]
+        return [
+            item["path"]
+            for item in items
+            if item["type"] == "blob" and item.get("size", 0) <= MAX_FILE_BYTES
+        ]
+
+    def compare(self, repo: str, base: str, head: str) -> Optional[List[ChangedFile]]:
+        """The files changed between two commits, or None if they can't be
+        compared or are too many to be listed."""
+        try:
+            files = self._get(f"/repos/{repo}/compare/{base}...{head}").json()["files"]
+        except requests.HTTPError:
+            # The old commit is gone, e.g. after a force push.
+            return None
+        if len(files) >= COMPARE_MAX_FILES:
+            # The list may be cut off, and missing files would go unnoticed.
+            return None
+        return [
+            ChangedFile(
+                path=file["filename"],
+                status=file["status"],
+                previous_path=file.get("previous_filename", ""),
+            )
+            for file in files
+        ]
+
+    def file_content(self, repo: str, path: str, sha: str) -> Optional[str]:
+        """The text content of a file, or None if it isn't text."""
+        response = self._get(
+            f"/repos/{repo}/contents/{path}",
+            params={"ref": sha},
+            headers={"Accept": "application/vnd.github.raw"},
+        )
+        try:
+            return response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+
+
+class IngestManifest:
+    """Remembers the last ingested commit and the symbols of every repository."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS repos (repo TEXT PRIMARY KEY, sha TEXT NOT NULL)"
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS symbols (
+                    repo TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    short_name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    chunk_id TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS symbols_by_name "
+                "ON symbols (repo, short_name)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS symbols_by_path ON symbols (repo, path)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_sha(self, repo: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha FROM repos WHERE repo = ?", (repo,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_sha(self, repo: str, sha: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO repos (repo, sha) VALUES (?, ?) "
+                "ON CONFLICT(repo) DO UPDATE SET sha = excluded.sha",
+                (repo, sha),
+            )
+
+    def set_symbols(self, repo: str, path: str, symbols: List[Symbol]) -> None:
+        """Replace the symbols recorded for a file."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM symbols WHERE repo = ? AND path = ?", (repo, path)
+            )
+            conn.executemany(
+                "INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        repo,
+                        path,
+                        symbol.name,
+                        symbol.name.rsplit(".", 1)[-1],
+                        symbol.kind,
+                        symbol.line,
+                        chunk_id(repo, path, symbol.chunk),
+                    )
+                    for symbol in symbols
+                ],
+            )
+
+    def delete_symbols(self, repo: str, path: Optional[str] = None) -> None:
+        """Delete the symbols of a file, or of the whole repository."""
+        with self._connect() as conn:
+            if path is None:
+                conn.execute("DELETE FROM symbols WHERE repo = ?", (repo,))
+            else:
+                conn.execute(
+                    "DELETE FROM symbols WHERE repo = ? AND path = ?", (repo, path)
+                )
+
+    def find_symbols(self, repo: str, name: str) -> List[SymbolLocation]:
+        """Find the definitions of `name`, either `func` or `Class.method`."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, kind, path, line, chunk_id FROM symbols "
+                "WHERE repo = ? AND short_name = ? AND (name = ? OR name LIKE ?) "
+                "ORDER BY path, line",
+                (repo, name.rsplit(".", 1)[-1], name, f"%.{name}"),
+            ).fetchall()
+        return [SymbolLocation(*row) for row in rows]
+
+
+def is_text_path(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() not in BINARY_EXTENSIONS
+
+
+def chunk_id(repo: str, path: str, index: int) -> str:
+    return hashlib.sha256(f"{repo}:{path}:{index}".encode()).hexdigest()
+
+
+def _file_filter(repo: str, path: str) -> dict:
+    return {"$and": [{"repo": repo}, {"path": path}]}
+
+
+def delete_file(app, manifest: IngestManifest, repo: str, path: str) -> None:
+    """Delete the vectors and symbols of a single file."""
+    app.db.delete(where=_file_filter(repo, path))
+    manifest.delete_symbols(repo, path)
+
+
+def delete_repo(app, manifest: IngestManifest, repo: str) -> None:
+    """Delete the vectors and symbols of every file of a repository."""
+    app.db.delete(where={"repo": repo})
+    manifest.delete_symbols(repo)
+
+
+def chunk_metadata(app, repo: str, path: str, url: str, chunk: CodeChunk) -> dict:
+    metadata = {
+        "repo": repo,
+        "path": path,
+        "url": url,
+        "line": chunk.start_line,
+        "symbols": ", ".join(chunk.symbols),
+    }
+    # embedchain only retrieves the chunks of its own app, like `App.add` does.
+    if getattr(app.config, "id", None):
+        metadata["app_id"] = app.config.id
+    return metadata
+
+
+def add_file(
+    app, manifest: IngestManifest, repo: str, path: str, sha: str, content: str
+) -> None:
+    """Embed a file, replacing whatever was stored for it before."""
+    delete_file(app, manifest, repo, path)
+    chunks, symbols = chunk_code(path, content)
+    if not chunks:
+        return
+    url = f"https://github.com/{repo}/blob/{sha}/{path}"
+    app.db.add(
+        documents=[chunk.text for chunk in chunks],
+        metadatas=[
+            chunk_metadata(app, repo, path, f"{url}#L{chunk.start_line}", chunk)
+            for chunk in chunks
+        ],
+        ids=[chunk_id(repo, path, i) for i in range(len(chunks))],
+    )
+    manifest.set_symbols(repo, path, symbols)
+
+
+def sync_repo(
+    app, client: GithubClient, manifest: IngestManifest, repo: str
+) -> Iterator[IngestProgress]:
+    """Bring the vectors of a repository up to date with its default branch.
+
+    Yields after every processed file so callers can report progress.
+    """
+    head = client.head_sha(repo)
+    base = manifest.get_sha(repo)
+    if base == head:
+        return
+
+    changes = client.compare(repo, base, head) if base else None
+    if changes is None:
+        delete_repo(app, manifest, repo)
+        changes = [
+            ChangedFile(path=path, status="added")
+            for path in client.list_files(repo, head)
+        ]
+
+    for done, change in enumerate(changes, start=1):
+        if change.previous_path:
+            delete_file(app, manifest, repo, change.previous_path)
+        if change.status == "removed":
+            delete_file(app, manifest, repo, change.path)
+        else:
+            content = None
+            if is_text_path(change.path):
+                content = client.file_content(repo, change.path, head)
+            if content is not None and len(content) <= MAX_FILE_BYTES:
+                add_file(app, manifest, repo, change.path, head, content)
+            else:
+                # It may have been text before, so its old chunks must go.
+                delete_file(app, manifest, repo, change.path)
+        yield IngestProgress(done=done, total=len(changes), path=change.path, sha=head)
+
+    manifest.set_sha(repo, head)
@@ -0,0 +1,260 @@
+"""Ingestion of repositories from a local checkout instead of the GitHub API.
+
+A repository is either read from an existing local path or shallow-cloned
+once into a cache directory. Local paths are only read under
+`LOCAL_REPO_ROOT`, and not at all if it isn't set, since whatever is indexed
+can be read back through the chat. Files are listed with git (so .gitignore is
+honored), filtered, read and chunked in a process pool, and the chunks are
+written to the vector store in batches.
+"""
+
+import fnmatch
+import multiprocessing
+import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator, List, Optional, Tuple
+
+from chat.code_chunker import CodeChunk, Symbol, chunk_code
+from chat.ingest import (
+    MAX_FILE_BYTES,
+    ChangedFile,
+    IngestManifest,
+    IngestProgress,
+    chunk_id,
+    chunk_metadata,
+    delete_file,
+    delete_repo,
+    is_text_path,
+)
+
+CLONE_DIR = os.getenv(
+    "REPO_CLONE_DIR", os.path.join(tempfile.gettempdir(), "reflex_repo_clones")
+)
+
+# The directory local repositories may be read from; unset, none may be.
+LOCAL_REPO_ROOT = os.getenv("LOCAL_REPO_ROOT", "")
+
+GITHUB_NAME = re.compile(r"^[\w.-]+/[\w.-]+$")
+
+# Number of chunks written to the vector store at once.
+BATCH_SIZE = 256
+
+SKIPPED_DIRS = {".git", "node_modules", "__pycache__", ".venv", "venv", ".web"}
+
+
+def _git(root: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", root, *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def is_local_path(source: str) -> bool:
+    """Whether `source` is a path rather than an `owner/repo` name or a URL."""
+    return source.startswith(("/", "~", ".")) or os.path.isabs(source)
+
+
+def _inside(root: str, path: str) -> bool:
+    return os.path.commonpath([root, path]) == root
+
+
+def local_path(source: str) -> str:
+    """The resolved path of a local repository, if it may be read."""
+    if not LOCAL_REPO_ROOT:
+        raise ValueError("Local repositories are disabled, set LOCAL_REPO_ROOT.")
+    root = os.path.realpath(os.path.expanduser(LOCAL_REPO_ROOT))
+    # Resolved first, so neither `..` nor symlinks lead out of the root.
+    path = os.path.realpath(os.path.expanduser(source))
+    if not _inside(root, path):
+        raise ValueError(f"{source} is not under LOCAL_REPO_ROOT.")
+    if not os.path.isdir(path):
+        raise ValueError(f"{source} is not a directory.")
+    return path
+
+
+def repo_key(source: str) -> str:
+    """The name a repository is stored under: `owner/repo` or an absolute path."""
+    if is_local_path(source):
+        return local_path(source)
+    return source
+
+
+def checkout(source: str) -> str:
+    """Get a local checkout of `source`, a local path, an `owner/repo` name or
+    an https URL."""
+    if is_local_path(source):
+        return local_path(source)
+
+    if source.startswith("https://"):
+        url = source
+    elif GITHUB_NAME.match(source) and ".." not in source:
+        url = f"https://github.com/{source}.git"
+    else:
+        # Other git transports, like file://, would reach local repositories.
+        raise ValueError(f"{source} is not an owner/repo name or an https URL.")
+    root = os.path.join(CLONE_DIR, source.rstrip("/").replace("/", "__"))
+    if os.path.isdir(os.path.join(root, ".git")):
+        _git(root, "fetch", "--depth", "1", "origin", "HEAD")
+        _git(root, "reset", "--hard", "FETCH_HEAD")
+    else:
+        os.makedirs(CLONE_DIR, exist_ok=True)
+        subprocess.run(
+            ["git", "clone", "--depth", "1", "--single-branch", url, root],
+            check=True,
+            capture_output=True,
+        )
+    return root
+
+
+def head_sha(root: str) -> Optional[str]:
+    """The commit checked out at `root`, or None if it isn't a git checkout."""
+    try:
+        return _git(root, "rev-parse", "HEAD").strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def _gitignore_patterns(root: str) -> List[str]:
+    try:
+        with open(os.path.join(root, ".gitignore")) as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return []
+    return [line.rstrip("/") for line in lines if line and not line.startswith("#")]
+
+
+def _walk(root: str) -> List[str]:
+    """List files of a directory that isn't a git checkout."""
+    patterns = _gitignore_patterns(root)
+
+    def ignored(rel_path: str) -> bool:
+        name = os.path.basename(rel_path)
+        return any(
+            fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns
+        )
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        dirnames[:] = [
+            d
+            for d in dirnames
+            if d not in SKIPPED_DIRS
+            and not ignored(os.path.normpath(os.path.join(rel_dir, d)))
+        ]
+        for filename in filenames:
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename))
+            if not ignored(rel_path):
+                paths.append(rel_path)
+    return paths
+
+
+def list_files(root: str) -> List[str]:
+    """The text files of a checkout worth embedding."""
+    if head_sha(root):
+        output = _git(
+            root, "ls-files", "-z", "--cached", "--others", "--exclude-standard"
+        )
+        paths = [path for path in output.split("\0") if path]
+    else:
+        paths = _walk(root)
+    real_root = os.path.realpath(root)
+    return [
+        path
+        for path in paths
+        if is_text_path(path)
+        # Symlinks may point out of the checkout.
+        and _inside(real_root, os.path.realpath(os.path.join(root, path)))
+        and os.path.isfile(os.path.join(root, path))
+        and os.path.getsize(os.path.join(root, path)) <= MAX_FILE_BYTES
+    ]
+
+
+def changed_files(root: str, base: str, head: str) -> Optional[List[ChangedFile]]:
+    """The files changed between two commits, or None if `base` isn't available."""
+    try:
+        output = _git(root, "diff", "--name-status", "--relative", "-M", base, head)
+    except subprocess.CalledProcessError:
+        # Shallow clones don't have the old commit.
+        return None
+    statuses = {"A": "added", "M": "modified", "D": "removed", "R": "renamed"}
+    changes = []
+    for line in output.splitlines():
+        status, *paths = line.split("\t")
+        changes.append(
+            ChangedFile(
+                path=paths[-1],
+                status=statuses.get(status[0], "modified"),
+                previous_path=paths[0] if len(paths) > 1 else "",
+            )
+        )
+    return changes
+
+
+def parse_file(root: str, path: str) -> Tuple[str, List[CodeChunk], List[Symbol]]:
+    """Read and chunk a single file. Runs in a worker process."""
+    try:
+        with open(os.path.join(root, path), "rb") as f:
+            data = f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return path, [], []
+    if b"\0" in data[:8192]:
+        return path, [], []
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return path, [], []
+    return (path, *chunk_code(path, text))
+
+
+def ingest_local(
+    app, manifest: IngestManifest, source: str
+) -> Iterator[IngestProgress]:
+    """Bring the vectors of a local or cloned repository up to date.
+
+    Yields after every batch written to the vector store.
+    """
+    root = checkout(source)
+    repo = repo_key(source)
+    head = head_sha(root) or ""
+    base = manifest.get_sha(repo)
+    if head and base == head:
+        return
+
+    changes = changed_files(root, base, head) if base and head else None
+    if changes is None:
+        delete_repo(app, manifest, repo)
+        paths = list_files(root)
+    else:
+        for change in changes:
+            delete_file(app, manifest, repo, change.path)
+            if change.previous_path:
+                delete_file(app, manifest, repo, change.previous_path)
+        wanted = set(list_files(root))
+        paths = [c.path for c in changes if c.status != "removed" and c.path in wanted]
+
+    documents, metadatas, ids = [], [], []
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        parsed = pool.map(parse_file, repeat(root), paths, chunksize=32)
+        for done, (path, chunks, symbols) in enumerate(parsed, start=1):
+            for i, chunk in enumerate(chunks):
+                documents.append(chunk.text)
+                metadatas.append(
+                    chunk_metadata(
+                        app, repo, path, f"{path}#L{chunk.start_line}", chunk
+                    )
+                )
+                ids.append(chunk_id(repo, path, i))
+            manifest.set_symbols(repo, path, symbols)
+            if len(documents) >= BATCH_SIZE or done == len(paths):
+                if documents:
+                    app.db.add(documents=documents, metadatas=metadatas, ids=ids)
+                    documents, metadatas, ids = [], [], []
+                yield IngestProgress(done=done, total=len(paths), path=path, sha=head)
+    if not paths:
+        yield IngestProgress(done=0, total=0, path="", sha=head)
+
+    manifest.set_sha(repo, head)
@@ -0,0 +1,90 @@
+"""A bounded, per-process registry of embedchain Apps, one per repository.
+
+Every repository gets its own Chroma collection, so questions about one
+repository never retrieve chunks of another, and sessions working on
+different repositories don't share an App. The least recently used Apps are
+dropped once the registry is full; their vectors stay on disk and the
+collection is reopened the next time the repository is used.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from embedchain import App
+
+# The vector store and the ingest manifest. They must outlive the server
+# process, or every restart re-ingests every repository in full.
+DB_DIR = os.getenv("CHROMA_DIR", "knowledge_base")
+
+# How many repository Apps are kept open per process.
+MAX_APPS = int(os.getenv("MAX_REPO_APPS", "8"))
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+
+def collection_name(repo: str) -> str:
+    """A valid Chroma collection name, unique for the repository."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", repo).strip("-_")[:40] or "repo"
+    digest = hashlib.sha1(repo.encode()).hexdigest()[:8]
+    return f"{slug}-{digest}"
+
+
+def create_app(repo: str) -> App:
+    return App.from_config(
+        config={
+            "llm": {
+                "provider": "ollama",
+                "config": {
+                    "model": "llama3:instruct",
+                    "max_tokens": 250,
+                    "temperature": 0.5,
+                    "stream": True,
+                    "base_url": OLLAMA_BASE_URL,
+                },
+            },
+            "vectordb": {
+                "provider": "chroma",
+                "config": {"dir": DB_DIR, "collection_name": collection_name(repo)},
+            },
+            "embedder": {
+                "provider": "ollama",
+                "config": {
+                    "model": "llama3:instruct",
+                    "base_url": OLLAMA_BASE_URL,
+                },
+            },
+        }
+    )
+
+
+class AppRegistry:
+    """Keeps the Apps of the most recently used repositories open."""
+
+    def __init__(self, max_size: int = MAX_APPS):
+        self.max_size = max_size
+        self._apps: OrderedDict[str, App] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repo: str) -> App:
+        """Get the App of a repository, creating it if needed."""
+        with self._lock:
+            app = self._apps.get(repo)
+            if app is not None:
+                self._apps.move_to_end(repo)
+                return app
+
+        # Created outside the lock so other repositories aren't blocked meanwhile.
+        app = create_app(repo)
+
+        with self._lock:
+            app = self._apps.setdefault(repo, app)
+            self._apps.move_to_end(repo)
+            while len(self._apps) > self.max_size:
+                self._apps.popitem(last=False)
+            return app
+
+
+app_registry = AppRegistry()
@@ -0,0 +1,55 @@
+"""Answer "where is X defined" questions straight from the symbol index."""
+
+import os
+import re
+from typing import List, Optional
+
+from chat.ingest import IngestManifest, SymbolLocation
+
+# "Where is X defined?", "where's the class `X` declared", "in which file is
+# X() defined": questions that only ask for the location of a definition.
+DEFINITION_QUESTION = re.compile(
+    r"^\s*(?:where\s+(?:is|was)|where's|in\s+which\s+file\s+is)\s+"
+    r"(?:the\s+)?(?:(?:function|class|method|variable)\s+)?"
+    r"`?([A-Za-z_][\w.]*)(?:\(\))?`?\s+(?:defined|declared)\s*\??\s*$",
+    re.IGNORECASE,
+)
+
+
+def _source(app, location: SymbolLocation) -> str:
+    result = app.db.get(ids=[location.chunk_id])
+    documents = result.get("documents") or []
+    return documents[0] if documents else ""
+
+
+def _format(app, locations: List[SymbolLocation]) -> str:
+    parts = []
+    for location in locations:
+        language = os.path.splitext(location.path)[1].lstrip(".")
+        parts.append(
+            f"**{location.name}** ({location.kind}) is defined in "
+            f"`{location.path}:{location.line}`"
+        )
+        source = _source(app, location)
+        if source:
+            parts.append(f"```{language}\n{source.rstrip()}\n```")
+    return "\n\n".join(parts)
+
+
+def answer_from_symbols(
+    app, manifest: IngestManifest, repo: str, question: str
+) -> Optional[str]:
+    """Answer a definition question from the symbol index, if it can be."""
+    match = DEFINITION_QUESTION.match(question) if repo else None
+    if match is None:
+        return None
+    # Without a definition of that exact name, the question goes to the model.
+    name = match.group(1)
+    locations = [
+        location
+        for location in manifest.find_symbols(repo, name)
+        if location.name == name or location.name.endswith(f".{name}")
+    ]
+    if not locations:
+        return None
+    return _format(app, locations[:5])
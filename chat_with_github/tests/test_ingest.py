@@ -0,0 +1,291 @@
+"""Incremental ingestion against a local stand-in for the GitHub API."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from chat import ingest
+from chat.ingest import GithubClient, IngestManifest, sync_repo
+
+REPO = "octo/demo"
+
+
+class FakeGithub:
+    """Commits of one repository, each a dict of path -> content."""
+
+    def __init__(self):
+        self.commits: dict[str, dict[str, str]] = {}
+        # Per commit, renamed paths: new path -> previous path.
+        self.renames: dict[str, dict[str, str]] = {}
+        self.head = ""
+        self.truncated = False
+        self.requests: list[str] = []
+
+    def commit(self, sha: str, files: dict, renames: dict = None) -> None:
+        self.commits[sha] = dict(files)
+        self.renames[sha] = renames or {}
+        self.head = sha
+
+    def compare(self, base: str, head: str) -> dict:
+        old, new = self.commits[base], self.commits[head]
+        renames = self.renames[head]
+        files = []
+        for path in sorted(set(old) | set(new)):
+            if path in renames.values() and path not in new:
+                continue
+            if path in renames:
+                files.append(
+                    {
+                        "filename": path,
+                        "status": "renamed",
+                        "previous_filename": renames[path],
+                    }
+                )
+            elif path not in old:
+                files.append({"filename": path, "status": "added"})
+            elif path not in new:
+                files.append({"filename": path, "status": "removed"})
+            elif old[path] != new[path]:
+                files.append({"filename": path, "status": "modified"})
+        return {"files": files}
+
+    def tree(self, tree_sha: str, recursive: bool) -> dict:
+        # Tree SHAs are "<commit>:<directory>", the root being "<commit>".
+        commit, _, directory = tree_sha.partition(":")
+        prefix = f"{directory}/" if directory else ""
+        items, subtrees = [], set()
+        for path, content in self.commits[commit].items():
+            if not path.startswith(prefix):
+                continue
+            rest = path[len(prefix) :]
+            if "/" in rest and not recursive:
+                subtrees.add(rest.split("/", 1)[0])
+            else:
+                items.append({"path": rest, "type": "blob", "size": len(content)})
+        items += [
+            {"path": name, "type": "tree", "sha": f"{commit}:{prefix}{name}"}
+            for name in sorted(subtrees)
+        ]
+        if recursive and self.truncated:
+            return {"tree": items[:1], "truncated": True}
+        return {"tree": items, "truncated": False}
+
+    def handle(self, path: str, query: dict):
+        parts = path.strip("/").split("/")
+        if parts[:3] != ["repos", *REPO.split("/")]:
+            return None
+        rest = parts[3:]
+        if not rest:
+            return {"default_branch": "main"}
+        if rest == ["commits", "main"]:
+            return {"sha": self.head}
+        if rest[0] == "compare":
+            base, _, head = rest[1].partition("...")
+            if base not in self.commits:
+                return None
+            return self.compare(base, head)
+        if rest[:2] == ["git", "trees"]:
+            return self.tree(rest[2], "recursive" in query)
+        if rest[0] == "contents":
+            return self.commits[query["ref"][0]].get("/".join(rest[1:]))
+        return None
+
+
+@pytest.fixture
+def github():
+    fake = FakeGithub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            fake.requests.append(url.path)
+            body = fake.handle(url.path, parse_qs(url.query))
+            if body is None:
+                self.send_error(404)
+                return
+            if isinstance(body, bytes):
+                data = body
+            else:
+                data = (body if isinstance(body, str) else json.dumps(body)).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fake.client = GithubClient(base_url=f"http://127.0.0.1:{server.server_port}")
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+class FakeCollection:
+    """The `add`/`delete`/`get` subset of embedchain's vector database."""
+
+    def __init__(self):
+        self.rows: dict[str, tuple[str, dict]] = {}
+
+    def add(self, documents, metadatas, ids):
+        for id_, document, metadata in zip(ids, documents, metadatas):
+            self.rows[id_] = (document, metadata)
+
+    def _matches(self, metadata: dict, where: dict) -> bool:
+        if "$and" in where:
+            return all(self._matches(metadata, clause) for clause in where["$and"])
+        return all(metadata.get(key) == value for key, value in where.items())
+
+    def delete(self, where):
+        for id_, (_, metadata) in list(self.rows.items()):
+            if self._matches(metadata, where):
+                del self.rows[id_]
+
+    def get(self, ids):
+        return {"documents": [self.rows[i][0] for i in ids if i in self.rows]}
+
+    def paths(self) -> set:
+        return {metadata["path"] for _, metadata in self.rows.values()}
+
+
+@pytest.fixture
+def app():
+    return SimpleNamespace(db=FakeCollection(), config=SimpleNamespace(id="app-1"))
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return IngestManifest(str(tmp_path / "manifest.db"))
+
+
+def sync(app, github, manifest) -> list:
+    return list(sync_repo(app, github.client, manifest, REPO))
+
+
+def symbol_paths(manifest, name: str) -> set:
+    return {location.path for location in manifest.find_symbols(REPO, name)}
+
+
+FILES = {
+    "app.py": "def main():\n    return helper()\n",
+    "lib/helper.py": "def helper():\n    return 1\n",
+    "lib/old.py": "def old_name():\n    return 2\n",
+    "lib/gone.py": "def gone():\n    return 3\n",
+    "logo.png": "not really an image",
+}
+
+
+def test_full_sync(app, github, manifest):
+    github.commit("c1", FILES)
+
+    progress = sync(app, github, manifest)
+
+    assert sorted(p.path for p in progress) == sorted(FILES)
+    assert manifest.get_sha(REPO) == "c1"
+    assert app.db.paths() == {"app.py", "lib/helper.py", "lib/old.py", "lib/gone.py"}
+    assert all(
+        metadata["app_id"] == "app-1" and metadata["repo"] == REPO
+        for _, metadata in app.db.rows.values()
+    )
+    assert symbol_paths(manifest, "helper") == {"lib/helper.py"}
+    # Nothing to do at the same commit.
+    assert sync(app, github, manifest) == []
+
+
+def test_incremental_sync(app, github, manifest):
+    github.commit("c1", FILES)
+    sync(app, github, manifest)
+
+    files = dict(FILES)
+    files["lib/helper.py"] = (
+        "def helper():\n    return 10\n\n\ndef extra():\n    pass\n"
+    )
+    files["lib/new.py"] = files.pop("lib/old.py").replace("old_name", "new_name")
+    del files["lib/gone.py"]
+    files["lib/added.py"] = "def added():\n    pass\n"
+    github.commit("c2", files, renames={"lib/new.py": "lib/old.py"})
+    github.requests.clear()
+
+    progress = sync(app, github, manifest)
+
+    assert sorted(p.path for p in progress) == [
+        "lib/added.py",
+        "lib/gone.py",
+        "lib/helper.py",
+        "lib/new.py",
+    ]
+    assert not any("/git/trees/" in path for path in github.requests)
+    assert manifest.get_sha(REPO) == "c2"
+    # Removed and renamed-away files leave neither vectors nor symbols behind.
+    assert app.db.paths() == {"app.py", "lib/helper.py", "lib/new.py", "lib/added.py"}
+    assert symbol_paths(manifest, "gone") == set()
+    assert symbol_paths(manifest, "old_name") == set()
+    assert symbol_paths(manifest, "new_name") == {"lib/new.py"}
+    assert symbol_paths(manifest, "extra") == {"lib/helper.py"}
+    helper = [
+        document
+        for document, metadata in app.db.rows.values()
+        if metadata["path"] == "lib/helper.py"
+    ]
+    assert any("return 10" in document for document in helper)
+    assert not any("return 1\n" in document for document in helper)
+
+
+def test_files_that_stop_being_text_are_deleted(app, github, manifest, monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_FILE_BYTES", 100)
+    github.commit("c1", FILES)
+    sync(app, github, manifest)
+    files = dict(FILES)
+    files["lib/helper.py"] = b"\xff\xfe not utf-8"
+    files["lib/old.py"] = "def old_name():\n" + "    pass\n" * 20
+    github.commit("c2", files)
+
+    sync(app, github, manifest)
+
+    assert app.db.paths() == {"app.py", "lib/gone.py"}
+    assert symbol_paths(manifest, "helper") == set()
+    assert symbol_paths(manifest, "old_name") == set()
+
+
+def test_unknown_base_resyncs_in_full(app, github, manifest):
+    github.commit("c1", FILES)
+    sync(app, github, manifest)
+    manifest.set_sha(REPO, "force-pushed")
+    github.commit("c2", {"app.py": "def main():\n    pass\n"})
+
+    sync(app, github, manifest)
+
+    assert app.db.paths() == {"app.py"}
+    assert symbol_paths(manifest, "helper") == set()
+
+
+def test_truncated_tree_is_walked(app, github, manifest):
+    github.commit("c1", FILES)
+    github.truncated = True
+
+    sync(app, github, manifest)
+
+    assert app.db.paths() == {"app.py", "lib/helper.py", "lib/old.py", "lib/gone.py"}
+
+
+def test_too_many_changes_resync_in_full(app, github, manifest, monkeypatch):
+    monkeypatch.setattr(ingest, "COMPARE_MAX_FILES", 2)
+    github.commit("c1", FILES)
+    sync(app, github, manifest)
+    files = {path: f"{content}# changed\n" for path, content in FILES.items()}
+    del files["lib/gone.py"]
+    github.commit("c2", files)
+    github.requests.clear()
+
+    sync(app, github, manifest)
+
+    assert any("/git/trees/" in path for path in github.requests)
+    assert app.db.paths() == {"app.py", "lib/helper.py", "lib/old.py"}
+    assert symbol_paths(manifest, "gone") == set()
@@ -0,0 +1,64 @@
+"""Definition questions answered from the symbol index."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from chat.code_chunker import chunk_code
+from chat.ingest import IngestManifest
+from chat.symbols import answer_from_symbols
+
+REPO = "octo/demo"
+
+SOURCE = """\
+def get_app():
+    return 1
+
+
+class Registry:
+    def get(self):
+        return 2
+"""
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.db"))
+    manifest.set_symbols(REPO, "app.py", chunk_code("app.py", SOURCE)[1])
+    return manifest
+
+
+@pytest.fixture
+def app():
+    return SimpleNamespace(db=SimpleNamespace(get=lambda ids: {"documents": []}))
+
+
+@pytest.mark.parametrize(
+    "question, path",
+    [
+        ("Where is `get_app` defined?", "`app.py:1`"),
+        ("where's the function get_app() declared", "`app.py:1`"),
+        ("In which file is Registry.get defined?", "`app.py:6`"),
+        ("where is get defined", "`app.py:6`"),
+    ],
+)
+def test_definition_questions(app, manifest, question, path):
+    answer = answer_from_symbols(app, manifest, REPO, question)
+
+    assert answer is not None and path in answer
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How is get_app implemented?",
+        "Find where get_app is used",
+        "Show me how Registry works",
+        "Where is get_app defined and why does it return 1?",
+        # No definition of that exact name.
+        "Where is get_ap defined?",
+        "Where is getXapp defined?",
+    ],
+)
+def test_other_questions_go_to_the_model(app, manifest, question):
+    assert answer_from_symbols(app, manifest, REPO, question) is None
@@ -33,4 +33,4 @@ def index() -> rx.Component:
 
 
 app = rx.App()
-app.add_page(index)
+app.add_page(index, on_load=State.watch_jobs)
@@ -1,12 +1,15 @@
 import reflex as rx
 from typing import List
 from dataclasses import dataclass
-import tempfile
-import base64
 import asyncio
 
 from embedchain import App
 
+from chat.jobs import KNOWLEDGE_BASE_DIR, IngestJob, app_config, get_job_queue
+
+# Seconds between two refreshes of the ingestion job statuses.
+JOB_POLL_INTERVAL = 1
+
 # Styles
 message_style = dict(
     display="inline-block",
@@ -67,38 +70,19 @@ class State(rx.State):
     """The app state."""
 
     chats: List[List[QA]] = [[]]
-    base64_pdf: str = ""
     uploading: bool = False
     current_chat: int = 0
     processing: bool = False
-    db_path: str = tempfile.mkdtemp()
+    db_path: str = KNOWLEDGE_BASE_DIR
     pdf_filename: str = ""
-    knowledge_base_files: List[str] = []
     upload_status: str = ""
+    # Ids of this browser's ingestion jobs, kept across page refreshes.
+    job_ids: str = rx.LocalStorage("", name="pdf_ingest_jobs")
+    jobs: List[IngestJob] = []
+    watching_jobs: bool = False
 
     def get_app(self):
-        return App.from_config(
-            config={
-                "llm": {
-                    "provider": "ollama",
-                    "config": {
-                        "model": "llama3.2:latest",
-                        "max_tokens": 250,
-                        "temperature": 0.5,
-                        "stream": True,
-                        "base_url": "http://localhost:11434",
-                    },
-                },
-                "vectordb": {"provider": "chroma", "config": {"dir": self.db_path}},
-                "embedder": {
-                    "provider": "ollama",
-                    "config": {
-                        "model": "llama3.2:latest",
-                        "base_url": "http://localhost:11434",
-                    },
-                },
-            }
-        )
+        return App.from_config(config=app_config(self.db_path))
 
     @rx.event(background=True)
     async def process_question(self, form_data: dict):
@@ -125,11 +109,10 @@ class State(rx.State):
             await asyncio.sleep(1)
 
     async def handle_upload(self, files: List[rx.UploadFile]):
-        """Handle file upload and processing."""
+        """Save the uploaded PDF and queue it for ingestion."""
         if not files:
             self.upload_status = "No file uploaded!"
             return
-            yield
 
         self.uploading = True
         yield
@@ -142,18 +125,37 @@ class State(rx.State):
         with outfile.open("wb") as file_object:
             file_object.write(upload_data)
 
-        # Base64 encode the PDF content
-        base64_pdf = base64.b64encode(upload_data).decode("utf-8")
+        job_id = get_job_queue().submit(str(outfile), file.filename, self.db_path)
+        self.job_ids = ",".join(filter(None, [self.job_ids, job_id]))
+        self.upload_status = f"Queued {self.pdf_filename} for ingestion"
 
-        self.base64_pdf = base64_pdf
+        self.uploading = False
+        yield State.watch_jobs
 
-        app = self.get_app()
-        app.add(str(outfile), data_type="pdf_file")
-        self.knowledge_base_files.append(self.pdf_filename)
-        self.upload_status = f"Added {self.pdf_filename} to knowledge base"
+    @rx.event(background=True)
+    async def watch_jobs(self):
+        """Poll the ingestion jobs of this browser until none are active."""
+        async with self:
+            if self.watching_jobs:
+                return
+            self.watching_jobs = True
 
-        self.uploading = False
-        yield
+        try:
+            while True:
+                async with self:
+                    job_ids = [i for i in self.job_ids.split(",") if i]
+
+                jobs = await asyncio.to_thread(get_job_queue().get, job_ids)
+
+                async with self:
+                    self.jobs = jobs
+
+                if not any(job.is_active() for job in jobs):
+                    break
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+        finally:
+            async with self:
+                self.watching_jobs = False
 
     def create_new_chat(self):
         """Create a new chat."""
@@ -166,16 +168,12 @@ def pdf_preview() -> rx.Component:
     return rx.box(
         rx.heading("PDF Preview", size="4", margin_bottom="1em"),
         rx.cond(
-            State.base64_pdf != "",
-            rx.html(
-                f"""
-                <iframe 
-                    src="data:application/pdf;base64,{State.base64_pdf}"
-                    width="100%" 
-                    height="600px"
-                    style="border: none; border-radius: 8px;">
-                </iframe>
-                """
+            State.pdf_filename != "",
+            rx.el.iframe(
+                src=rx.get_upload_url(State.pdf_filename),
+                width="100%",
+                height="600px",
+                style={"border": "none", "border_radius": "8px"},
             ),
             rx.text("No PDF uploaded yet", color="red"),
         ),
@@ -186,6 +184,45 @@ def pdf_preview() -> rx.Component:
     )
 
 
+def job_status(job: IngestJob) -> rx.Component:
+    """The progress of a single ingestion job."""
+    return rx.box(
+        rx.hstack(
+            rx.text(job.filename, font_size="sm", trim="both"),
+            rx.badge(
+                job.status,
+                color_scheme=rx.match(
+                    job.status,
+                    ("done", "green"),
+                    ("failed", "red"),
+                    "gray",
+                ),
+                margin_left="auto",
+            ),
+            width="100%",
+        ),
+        rx.cond(
+            job.pages_total > 0,
+            rx.text(
+                f"{job.pages_done} / {job.pages_total} pages",
+                font_size="xs",
+                color=rx.color("mauve", 11),
+            ),
+        ),
+        rx.cond(
+            job.status == "running",
+            rx.progress(value=job.progress, width="100%"),
+        ),
+        rx.cond(
+            job.error != "",
+            rx.text(job.error, font_size="xs", color="red"),
+        ),
+        padding="0.5em",
+        border_radius="md",
+        width="100%",
+    )
+
+
 def message(qa: QA) -> rx.Component:
     """A single question/answer message."""
     return rx.box(
@@ -311,15 +348,7 @@ def sidebar() -> rx.Component:
                 State.pdf_filename != "",
                 pdf_preview(),
             ),
-            rx.foreach(
-                State.knowledge_base_files,
-                lambda file: rx.box(
-                    rx.text(file, font_size="sm"),
-                    padding="0.5em",
-                    border_radius="md",
-                    width="100%",
-                ),
-            ),
+            rx.foreach(State.jobs, job_status),
             rx.text(State.upload_status, color=rx.color("mauve", 11), font_size="sm"),
             align_items="stretch",
             height="100%",
@@ -0,0 +1,326 @@
+"""Background ingestion of uploaded PDFs into the knowledge base.
+
+Uploads only enqueue a job; the embedding work happens in a small pool of
+worker processes so the upload request returns immediately. Jobs are stored in
+a local SQLite database and checkpointed after every page, which lets an
+interrupted job (server restart, crashed worker) resume where it stopped.
+
+A job whose worker process dies is queued again, up to `MAX_ATTEMPTS` times.
+Attempts are counted when a worker claims a job, so jobs still waiting in a
+pool that broke are queued again without being charged for it. On startup, jobs still marked as running belong to the previous server
+process, so they are queued again as well. Like the app's other in-process
+state, this assumes a single backend process.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import List, Optional
+
+JOBS_DB = os.getenv("INGEST_JOBS_DB", "ingest_jobs.db")
+
+# The Chroma directory of the knowledge base. It must outlive the server
+# process, since jobs resumed after a restart keep writing to it.
+KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "knowledge_base")
+
+# How many PDFs are embedded at the same time. Every worker talks to the same
+# Ollama server and Chroma directory, so keep this small.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+
+# A running job whose heartbeat is older than this is considered abandoned.
+STALE_AFTER_SECONDS = 300
+
+# How many times a job is started before a crashing worker fails it.
+MAX_ATTEMPTS = 3
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+
+def app_config(db_path: str) -> dict:
+    """The embedchain config shared by the chat and the ingestion workers."""
+    return {
+        "llm": {
+            "provider": "ollama",
+            "config": {
+                "model": "llama3.2:latest",
+                "max_tokens": 250,
+                "temperature": 0.5,
+                "stream": True,
+                "base_url": OLLAMA_BASE_URL,
+            },
+        },
+        "vectordb": {"provider": "chroma", "config": {"dir": db_path}},
+        "embedder": {
+            "provider": "ollama",
+            "config": {
+                "model": "llama3.2:latest",
+                "base_url": OLLAMA_BASE_URL,
+            },
+        },
+    }
+
+
+@dataclass
+class IngestJob:
+    """The status of a single PDF ingestion job."""
+
+    id: str
+    filename: str
+    status: str
+    pages_done: int
+    pages_total: int
+    progress: int
+    error: str
+
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+def _connect(jobs_db: str = JOBS_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(jobs_db, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            db_path TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            pages_total INTEGER NOT NULL DEFAULT 0,
+            error TEXT NOT NULL DEFAULT '',
+            created_at REAL NOT NULL,
+            heartbeat REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "attempts" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+
+def _to_job(row: sqlite3.Row) -> IngestJob:
+    total = row["pages_total"]
+    return IngestJob(
+        id=row["id"],
+        filename=row["filename"],
+        status=row["status"],
+        pages_done=row["pages_done"],
+        pages_total=total,
+        progress=int(100 * row["pages_done"] / total) if total else 0,
+        error=row["error"],
+    )
+
+
+def _claim(conn: sqlite3.Connection, job_id: str) -> Optional[sqlite3.Row]:
+    """Mark a job as running, unless another worker is already on it."""
+    now = time.time()
+    with conn:
+        claimed = conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'running', heartbeat = ?, attempts = attempts + 1
+            WHERE id = ? AND (
+                status = 'queued' OR (status = 'running' AND heartbeat < ?)
+            )
+            """,
+            (now, job_id, now - STALE_AFTER_SECONDS),
+        ).rowcount
+    if not claimed:
+        return None
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def run_job(job_id: str, jobs_db: str = JOBS_DB) -> None:
+    """Embed a PDF page by page, resuming after the last checkpointed page.
+
+    Runs inside a worker process.
+    """
+    from embedchain import App
+    from pypdf import PdfReader
+
+    conn = _connect(jobs_db)
+    try:
+        job = _claim(conn, job_id)
+        if job is None:
+            return
+
+        try:
+            reader = PdfReader(job["path"])
+            pages_total = len(reader.pages)
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET pages_total = ? WHERE id = ?",
+                    (pages_total, job_id),
+                )
+
+            app = App.from_config(config=app_config(job["db_path"]))
+            for page_number in range(job["pages_done"], pages_total):
+                text = reader.pages[page_number].extract_text() or ""
+                # Re-adding a page after a crash is harmless: embedchain skips
+                # chunks it has already stored.
+                if text.strip():
+                    app.add(
+                        text,
+                        data_type="text",
+                        metadata={"url": job["filename"], "page": page_number + 1},
+                    )
+                with conn:
+                    conn.execute(
+                        "UPDATE jobs SET pages_done = ?, heartbeat = ? WHERE id = ?",
+                        (page_number + 1, time.time(), job_id),
+                    )
+
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'done' WHERE id = ?", (job_id,))
+        except Exception as e:
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ? WHERE id = ?",
+                    (str(e), job_id),
+                )
+    finally:
+        conn.close()
+
+
+def _requeue(conn: sqlite3.Connection, job_id: Optional[str] = None) -> None:
+    """Queue a running job (or all of them) again, keeping its checkpoint."""
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running'"
+            + ("" if job_id is None else " AND id = ?"),
+            () if job_id is None else (job_id,),
+        )
+
+
+class JobQueue:
+    """Submits ingestion jobs to a bounded pool of worker processes."""
+
+    def __init__(self, jobs_db: str = JOBS_DB, max_workers: int = INGEST_WORKERS):
+        self.jobs_db = jobs_db
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _dispatch(self, job_id: str) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            executor = self._executor
+            try:
+                future = executor.submit(run_job, job_id, self.jobs_db)
+            except BrokenProcessPool:
+                executor = self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                future = executor.submit(run_job, job_id, self.jobs_db)
+        # Added outside the lock: the callback runs at once if the job is done.
+        future.add_done_callback(lambda future: self._on_done(job_id, executor, future))
+
+    def _on_done(self, job_id: str, executor: ProcessPoolExecutor, future) -> None:
+        """Retry a job whose worker died; `run_job` handles ordinary errors."""
+        if future.cancelled() or future.exception() is None:
+            return
+        with self._lock:
+            # A dead worker breaks the whole pool, so the next job gets a new one.
+            if self._executor is executor:
+                self._executor = None
+        conn = _connect(self.jobs_db)
+        try:
+            job = conn.execute(
+                "SELECT status, attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if job is None or job["status"] not in ("queued", "running"):
+                return
+            # Only a job a worker was running is charged for the crash; the
+            # ones waiting behind it are still queued and simply go again.
+            if job["status"] == "running" and job["attempts"] >= MAX_ATTEMPTS:
+                with conn:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ? WHERE id = ?",
+                        (
+                            f"The ingestion worker failed: {future.exception()}",
+                            job_id,
+                        ),
+                    )
+                return
+            _requeue(conn, job_id)
+        finally:
+            conn.close()
+        self._dispatch(job_id)
+
+    def submit(self, path: str, filename: str, db_path: str) -> str:
+        """Queue a PDF for ingestion and return the job id."""
+        job_id = uuid.uuid4().hex
+        conn = _connect(self.jobs_db)
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO jobs (id, filename, path, db_path, status, created_at)
+                    VALUES (?, ?, ?, ?, 'queued', ?)
+                    """,
+                    (job_id, filename, path, db_path, time.time()),
+                )
+        finally:
+            conn.close()
+        self._dispatch(job_id)
+        return job_id
+
+    def get(self, job_ids: List[str]) -> List[IngestJob]:
+        """Get the jobs with the given ids, oldest first."""
+        if not job_ids:
+            return []
+        conn = _connect(self.jobs_db)
+        try:
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))}) "
+                "ORDER BY created_at",
+                job_ids,
+            ).fetchall()
+        finally:
+            conn.close()
+        return [_to_job(row) for row in rows]
+
+    def resume(self) -> None:
+        """Re-dispatch jobs left unfinished by a previous server process."""
+        conn = _connect(self.jobs_db)
+        try:
+            # Their workers are gone, however recent their last heartbeat.
+            _requeue(conn)
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') "
+                "ORDER BY created_at"
+            ).fetchall()
+        finally:
+            conn.close()
+        for row in rows:
+            self._dispatch(row["id"])
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue, resuming unfinished jobs on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+            _job_queue.resume()
+        return _job_queue
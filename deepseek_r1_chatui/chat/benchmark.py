@@ -0,0 +1,115 @@
+"""Measure how fast streamed tokens reach the client.
+
+Compares the rate tokens are generated with the rate they are delivered to
+the client, both through `StreamBuffer` and through the previous approach of
+one state update plus a 50 ms sleep per chunk.
+
+Usage (from the app directory):
+
+    python -m chat.benchmark                 # stream a real answer from Ollama
+    python -m chat.benchmark --simulate 150  # a fake model at 150 tokens/s
+"""
+
+import argparse
+import asyncio
+import time
+from typing import AsyncIterator
+
+from chat.streaming import StreamBuffer
+
+PROMPT = "Explain how a hash map works, with an example in Python."
+
+# The sleep the previous streaming loop made after every chunk.
+LEGACY_SLEEP = 0.05
+
+
+async def simulated_stream(rate: float, tokens: int) -> AsyncIterator[dict]:
+    """Chunks of a fake model generating `rate` tokens per second."""
+    for i in range(tokens):
+        await asyncio.sleep(1 / rate)
+        done = i == tokens - 1
+        yield {
+            "message": {"content": "token "},
+            "done": done,
+            "eval_count": tokens if done else None,
+            "eval_duration": int(tokens / rate * 1e9) if done else None,
+        }
+
+
+async def ollama_stream(prompt: str) -> AsyncIterator[dict]:
+    """Chunks of a real answer from the chat model."""
+    from chat.state import KEEP_ALIVE, MODEL, ollama_client
+
+    async for chunk in await ollama_client.chat(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        keep_alive=KEEP_ALIVE,
+    ):
+        yield chunk
+
+
+async def deliver(
+    stream: AsyncIterator[dict], update_seconds: float, legacy: bool
+) -> dict:
+    """Consume a stream the way the app does, simulating the cost of an update."""
+    buffer = StreamBuffer()
+    updates, generated = 0, 0.0
+    start = None
+    async for chunk in stream:
+        start = start or time.monotonic()
+        if legacy:
+            await asyncio.sleep(update_seconds + LEGACY_SLEEP)
+            updates += 1
+        elif buffer.add(chunk["message"]["content"]):
+            await asyncio.sleep(update_seconds)
+            updates += 1
+        if chunk["done"] and chunk.get("eval_duration"):
+            generated = chunk["eval_count"] / (chunk["eval_duration"] / 1e9)
+    if not legacy and buffer.flush():
+        await asyncio.sleep(update_seconds)
+        updates += 1
+
+    elapsed = time.monotonic() - start if start else 0
+    chunks = buffer.chunks if not legacy else updates
+    return {
+        "chunks": chunks,
+        "updates": updates,
+        "generated": generated,
+        "delivered": chunks / elapsed if elapsed else 0.0,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--simulate",
+        type=float,
+        metavar="TOKENS_PER_SECOND",
+        help="Use a fake model instead of Ollama.",
+    )
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument(
+        "--update-ms",
+        type=float,
+        default=5,
+        help="Cost of sending one state update to the client.",
+    )
+    args = parser.parse_args()
+
+    def stream() -> AsyncIterator[dict]:
+        if args.simulate:
+            return simulated_stream(args.simulate, args.tokens)
+        return ollama_stream(PROMPT)
+
+    for name, legacy in (("per-chunk sleep", True), ("StreamBuffer", False)):
+        result = await deliver(stream(), args.update_ms / 1000, legacy)
+        print(
+            f"{name:>16}: generated {result['generated']:7.1f} tok/s, "
+            f"delivered {result['delivered']:7.1f} tok/s "
+            f"({result['chunks']} chunks in {result['updates']} updates)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,7 @@
 import reflex as rx
 
 from chat.components import chat, navbar
+from chat.state import State
 
 
 def index() -> rx.Component:
@@ -26,4 +27,4 @@ app = rx.App(
         accent_color="violet",
     ),
 )
-app.add_page(index)
+app.add_page(index, on_load=[State.load_chats, State.load_model])
@@ -0,0 +1,127 @@
+"""Send a question to several Ollama models at once and measure them.
+
+Every model streams concurrently through the shared client, with at most
+`MODEL_CONCURRENCY` requests per model in flight, each taking its turn in the
+scheduler like any other request. Time to first token,
+generation speed and total latency of every run are recorded in the chat
+store's metrics table, so the choice of model can be based on measurements.
+"""
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from chat.scheduler import scheduler
+
+COMPARE_MODELS = os.getenv(
+    "COMPARE_MODELS", "deepseek-r1:1.5b,llama3.2:latest,qwen2.5:1.5b"
+).split(",")
+
+# Requests per model that may run at the same time, across all sessions.
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "1"))
+
+_model_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def model_slot(model: str) -> asyncio.Semaphore:
+    if model not in _model_slots:
+        _model_slots[model] = asyncio.Semaphore(MODEL_CONCURRENCY)
+    return _model_slots[model]
+
+
+@dataclass
+class RunDelta:
+    """New answer text of a model, or its final metrics when `done`."""
+
+    model: str
+    text: str = ""
+    # The model's place in the scheduler queue, 0 once it is running.
+    queue_position: int = -1
+    done: bool = False
+    error: str = ""
+    ttft_ms: int = 0
+    tokens_per_s: float = 0.0
+    total_ms: int = 0
+
+
+async def stream_model(
+    client,
+    model: str,
+    messages: List[dict],
+    keep_alive: str,
+    num_ctx: int,
+    session: str,
+    on_wait: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> AsyncIterator[RunDelta]:
+    """Stream one model's answer, ending with a delta that holds its metrics."""
+    async with model_slot(model):
+        ttft_ms, tokens_per_s = 0, 0.0
+        try:
+            async with scheduler.slot(session, on_wait):
+                # Measured from admission, so queueing doesn't count against
+                # the model.
+                start = time.monotonic()
+                async for chunk in await client.chat(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    keep_alive=keep_alive,
+                    options={"num_ctx": num_ctx},
+                ):
+                    text = chunk["message"]["content"]
+                    if text and not ttft_ms:
+                        ttft_ms = int((time.monotonic() - start) * 1000)
+                    if chunk["done"] and chunk.get("eval_duration"):
+                        tokens_per_s = chunk["eval_count"] / (
+                            chunk["eval_duration"] / 1e9
+                        )
+                    yield RunDelta(model=model, text=text)
+        except Exception as e:
+            yield RunDelta(model=model, done=True, error=str(e))
+            return
+        yield RunDelta(
+            model=model,
+            done=True,
+            ttft_ms=ttft_ms,
+            tokens_per_s=round(tokens_per_s, 1),
+            total_ms=int((time.monotonic() - start) * 1000),
+        )
+
+
+async def fan_out(
+    client,
+    models: List[str],
+    messages: List[dict],
+    keep_alive: str,
+    num_ctx: int,
+    session: str,
+) -> AsyncIterator[RunDelta]:
+    """Merge the streams of several models as their deltas arrive."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(model: str):
+        async def on_wait(position: int):
+            await queue.put(RunDelta(model=model, queue_position=position))
+
+        async for delta in stream_model(
+            client,
+            model,
+            messages,
+            keep_alive,
+            num_ctx,
+            session,
+            on_wait,
+        ):
+            await queue.put(delta)
+
+    tasks = [asyncio.create_task(run(model)) for model in models]
+    try:
+        for _ in models:
+            while not (delta := await queue.get()).done:
+                yield delta
+            yield delta
+    finally:
+        for task in tasks:
+            task.cancel()
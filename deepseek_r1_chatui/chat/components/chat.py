@@ -1,7 +1,7 @@
 import reflex as rx
 
 from chat.components import loading_icon
-from chat.state import QA, State
+from chat.state import QA, ModelAnswer, ModelMetrics, State
 
 
 message_style = dict(
@@ -21,10 +21,35 @@ def message(qa: QA) -> rx.Component:
     Returns:
         A component displaying the question/answer pair.
     """
+    return rx.box(
+        message_pair(qa.question, qa.answer),
+        rx.cond(
+            ~qa.complete,
+            rx.text(
+                "Stopped before the answer was finished.",
+                color=rx.color("mauve", 10),
+                size="1",
+                padding_top="0.25em",
+            ),
+        ),
+        width="100%",
+    )
+
+
+def message_pair(question: rx.Var[str], answer: rx.Var[str]) -> rx.Component:
+    """A question and its answer.
+
+    Args:
+        question: The question.
+        answer: The answer.
+
+    Returns:
+        A component displaying the question and the answer.
+    """
     return rx.box(
         rx.box(
             rx.markdown(
-                qa.question,
+                question,
                 background_color=rx.color("mauve", 4),
                 color=rx.color("mauve", 12),
                 **message_style,
@@ -34,7 +59,7 @@ def message(qa: QA) -> rx.Component:
         ),
         rx.box(
             rx.markdown(
-                qa.answer,
+                answer,
                 background_color=rx.color("accent", 4),
                 color=rx.color("accent", 12),
                 **message_style,
@@ -46,10 +71,158 @@ def message(qa: QA) -> rx.Component:
     )
 
 
+def model_answer(result: ModelAnswer) -> rx.Component:
+    """A model's answer in comparison mode, with its metrics.
+
+    Args:
+        result: The model's answer.
+
+    Returns:
+        A card with the model name, its metrics and its answer.
+    """
+    return rx.card(
+        rx.vstack(
+            rx.hstack(
+                rx.heading(result.model, size="3"),
+                rx.cond(
+                    ~result.done & (result.queue_position > 0),
+                    rx.badge(
+                        f"Queued #{result.queue_position}",
+                        variant="soft",
+                        color_scheme="gray",
+                    ),
+                    rx.cond(
+                        result.done,
+                        rx.cond(
+                            result.error == "",
+                            rx.badge(
+                                f"TTFT {result.ttft_ms} ms"
+                                f" · {result.tokens_per_s} tok/s"
+                                f" · {result.total_ms} ms",
+                                variant="soft",
+                                color_scheme="green",
+                            ),
+                            rx.badge("Incomplete", variant="soft", color_scheme="red"),
+                        ),
+                        loading_icon(height="1em"),
+                    ),
+                ),
+                justify_content="space-between",
+                align_items="center",
+                width="100%",
+            ),
+            rx.markdown(result.answer),
+            rx.cond(
+                result.error != "",
+                rx.text(result.error, color=rx.color("red", 11), size="2"),
+            ),
+            width="100%",
+        ),
+        width="100%",
+    )
+
+
+def metric_row(stats: ModelMetrics) -> rx.Component:
+    return rx.table.row(
+        rx.table.row_header_cell(stats.model),
+        rx.table.cell(stats.runs),
+        rx.table.cell(f"{stats.ttft_ms} ms"),
+        rx.table.cell(stats.tokens_per_s),
+        rx.table.cell(f"{stats.total_ms} ms"),
+    )
+
+
+def metrics_table() -> rx.Component:
+    """The average metrics of every model compared so far."""
+    return rx.table.root(
+        rx.table.header(
+            rx.table.row(
+                rx.table.column_header_cell("Model"),
+                rx.table.column_header_cell("Runs"),
+                rx.table.column_header_cell("Time to first token"),
+                rx.table.column_header_cell("Tokens/s"),
+                rx.table.column_header_cell("Total latency"),
+            ),
+        ),
+        rx.table.body(rx.foreach(State.model_stats, metric_row)),
+        width="100%",
+    )
+
+
+def comparison() -> rx.Component:
+    """The answers of the selected models to the last question, side by side."""
+    return rx.vstack(
+        rx.hstack(
+            rx.foreach(
+                State.compare_models,
+                lambda model: rx.checkbox(
+                    model,
+                    checked=State.selected_models.contains(model),
+                    on_change=lambda selected: State.toggle_model(model, selected),
+                ),
+            ),
+            spacing="4",
+            wrap="wrap",
+        ),
+        rx.cond(
+            State.comparison_question != "",
+            rx.markdown(
+                State.comparison_question,
+                background_color=rx.color("mauve", 4),
+                color=rx.color("mauve", 12),
+                **message_style,
+            ),
+        ),
+        rx.grid(
+            rx.foreach(State.comparison, model_answer),
+            columns=rx.breakpoints(initial="1", md="2", lg="3"),
+            spacing="4",
+            width="100%",
+        ),
+        rx.cond(State.model_stats, metrics_table()),
+        py="8",
+        flex="1",
+        width="100%",
+        padding_x="2em",
+        padding_bottom="5em",
+        spacing="4",
+    )
+
+
 def chat() -> rx.Component:
     """List all the messages in a single conversation."""
+    return rx.cond(State.compare_mode, comparison(), conversation())
+
+
+def conversation() -> rx.Component:
+    """The messages of the current chat."""
     return rx.vstack(
-        rx.box(rx.foreach(State.chats[State.current_chat], message), width="100%"),
+        rx.cond(
+            State.has_older_messages,
+            rx.button(
+                "Load earlier messages",
+                on_click=State.load_older_messages,
+                variant="ghost",
+                align_self="center",
+            ),
+        ),
+        rx.box(
+            rx.foreach(State.messages, message),
+            rx.cond(
+                State.processing & (State.streaming_chat == State.current_chat),
+                message_pair(State.streaming_question, State.streaming_answer),
+            ),
+            rx.cond(
+                State.processing & (State.queue_position > 0),
+                rx.text(
+                    f"Waiting for the model, position {State.queue_position}"
+                    " in the queue...",
+                    color=rx.color("mauve", 11),
+                    size="2",
+                ),
+            ),
+            width="100%",
+        ),
         py="8",
         flex="1",
         width="100%",
@@ -76,22 +249,28 @@ def action_bar() -> rx.Component:
                         _focus={"border_color": rx.color("mauve", 8)},
                         background_color="transparent",
                     ),
-                    rx.button(
-                        rx.cond(
-                            State.processing,
+                    rx.cond(
+                        State.processing,
+                        rx.button(
                             loading_icon(height="1em"),
+                            rx.text("Stop"),
+                            type_="button",
+                            on_click=State.stop_generation,
+                            color_scheme="red",
+                            variant="soft",
+                        ),
+                        rx.button(
                             rx.text("Send"),
+                            type_="submit",
+                            bg=rx.color("accent", 9),
+                            color="white",
+                            _hover={"bg": rx.color("accent", 10)},
                         ),
-                        type_="submit",
-                        disabled=State.processing,
-                        bg=rx.color("accent", 9),
-                        color="white",
-                        _hover={"bg": rx.color("accent", 10)},
                     ),
                     align_items="center",
                     spacing="3",
                 ),
-                on_submit=State.process_question,
+                on_submit=State.submit_question,
                 width="100%",
                 reset_on_submit=True,
             ),
@@ -99,9 +99,41 @@ def navbar():
                         variant="soft",
                     )
                 ),
+                rx.desktop_only(
+                    rx.badge(
+                        rx.cond(
+                            State.model_loaded,
+                            f"Prompt eval: {State.prompt_eval_tokens} tokens"
+                            f" in {State.prompt_eval_ms} ms",
+                            "Loading model...",
+                        ),
+                        rx.tooltip(
+                            rx.icon("info", size=14),
+                            content="Prompt tokens Ollama evaluated for the last "
+                            "question. Earlier turns are reused from its cache.",
+                        ),
+                        variant="soft",
+                        color_scheme=rx.cond(State.model_loaded, "green", "gray"),
+                    )
+                ),
                 align_items="center",
             ),
             rx.hstack(
+                rx.tooltip(
+                    rx.text(
+                        rx.flex(
+                            rx.switch(
+                                checked=State.compare_mode,
+                                on_change=State.set_compare_mode,
+                            ),
+                            "Compare models",
+                            spacing="2",
+                        ),
+                        as_="label",
+                        size="2",
+                    ),
+                    content="Send each question to several models at once.",
+                ),
                 modal(rx.button("+ New chat")),
                 sidebar(
                     rx.button(
@@ -0,0 +1,203 @@
+"""Build the message list sent to Ollama for a question.
+
+The conversation is sent as native chat messages, newest turns first until the
+token budget of the model's context window (`NUM_CTX`) is used up. Turns that
+fall out of the window are folded into a running summary, which is sent as
+part of the system message. The summary is brought up to date in the
+background once the window is close to full, so it is usually ready by the
+time the window moves.
+
+The window only moves when it overflows, and then drops enough old turns to
+leave room for several more. In between, every request is the previous one
+plus the new turns, so Ollama can reuse its cached prompt prefix instead of
+evaluating the whole conversation again.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+
+# Tokens kept free for the model's answer.
+RESPONSE_RESERVE = 1024
+
+# The summary is generated with thinking turned off; this only bounds its length.
+SUMMARY_MAX_TOKENS = 512
+
+# Once the window's turns use this fraction of the budget, the turns it will
+# drop when it moves are summarized ahead of time.
+SUMMARY_TRIGGER = 0.8
+
+# When the window overflows, it is refilled up to this fraction of the budget.
+WINDOW_REFILL = 0.5
+
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant. Use the conversation so far to provide "
+    "a detailed and helpful response to the user's latest question."
+)
+
+SUMMARY_PROMPT = """Update the summary of a conversation with the new turns below.
+Keep every fact, name, number and decision the user may refer to later. Answer
+with the updated summary only.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}"""
+
+THINK_BLOCK = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the token count of a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def strip_thinking(answer: str) -> str:
+    """Drop the <think> block of a reasoning model's answer."""
+    return THINK_BLOCK.sub("", answer).strip()
+
+
+@dataclass
+class Summary:
+    """A running summary of the oldest turns of a chat."""
+
+    text: str = ""
+    # Number of turns, from the start of the chat, covered by the summary.
+    turns: int = 0
+
+
+@dataclass
+class ContextWindow:
+    """The part of a chat currently sent to the model.
+
+    Kept fixed between requests so the prompt prefix stays the same.
+    """
+
+    # Index of the oldest turn in the window.
+    start: int = 0
+    # The summary of the turns before `start`, as it was when the window moved.
+    summary: str = ""
+
+
+def turn_messages(question: str, answer: str) -> List[dict]:
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": strip_thinking(answer)},
+    ]
+
+
+def summary_messages(summary: Summary, turns: List[Tuple[str, str]]) -> List[dict]:
+    """The request that folds `turns` into the summary."""
+    rendered = "\n".join(
+        f"User: {question}\nAssistant: {strip_thinking(answer)}"
+        for question, answer in turns
+    )
+    prompt = SUMMARY_PROMPT.format(summary=summary.text or "(empty)", turns=rendered)
+    return [{"role": "user", "content": prompt}]
+
+
+class ContextBuilder:
+    """Fits a conversation into the model's context window."""
+
+    def __init__(
+        self,
+        num_ctx: int = NUM_CTX,
+        reserve: int = RESPONSE_RESERVE,
+        system_prompt: str = SYSTEM_PROMPT,
+    ):
+        self.num_ctx = num_ctx
+        self.reserve = reserve
+        self.system_prompt = system_prompt
+
+    def system_message(self, summary: str) -> dict:
+        content = self.system_prompt
+        if summary:
+            content += f"\n\nSummary of the earlier conversation:\n{summary}"
+        return {"role": "system", "content": content}
+
+    def budget(self, question: str, summary: str) -> int:
+        """Tokens left for previous turns."""
+        return (
+            self.num_ctx
+            - self.reserve
+            - count_tokens(self.system_message(summary)["content"])
+            - count_tokens(question)
+        )
+
+    def window_start(self, turns: List[Tuple[str, str]], budget: int) -> int:
+        """Index of the oldest of the latest turns that fit in `budget`."""
+        start = len(turns)
+        while start > 0:
+            question, answer = turns[start - 1]
+            cost = count_tokens(question) + count_tokens(strip_thinking(answer))
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        return start
+
+    def next_start(
+        self,
+        turns: List[Tuple[str, str]],
+        question: str,
+        window: ContextWindow,
+        summary: Summary,
+    ) -> int:
+        """Where the window should start for a question, counted from the start
+        of the chat; it only moves when it overflows.
+
+        The summary must cover the turns before this start before the window can
+        move there (see `build`).
+        """
+        if self.window_start(turns, self.budget(question, window.summary)) == 0:
+            return window.start
+        # The window overflowed: move it, making room for the next turns too.
+        budget = self.budget(question, summary.text)
+        return window.start + self.window_start(turns, int(budget * WINDOW_REFILL))
+
+    def summary_start(
+        self, turns: List[Tuple[str, str]], window: ContextWindow, summary: Summary
+    ) -> int:
+        """Where the window will move next, once it is close to full, so the
+        summary can be brought up to there ahead of time; `window.start` while
+        it has room."""
+        budget = self.budget("", window.summary)
+        if self.window_start(turns, int(budget * SUMMARY_TRIGGER)) == 0:
+            return window.start
+        budget = self.budget("", summary.text)
+        return window.start + self.window_start(turns, int(budget * WINDOW_REFILL))
+
+    def build(
+        self,
+        turns: List[Tuple[str, str]],
+        question: str,
+        window: ContextWindow,
+        summary: Summary,
+    ) -> Tuple[List[dict], ContextWindow]:
+        """The messages for a question, and the window they were built from.
+
+        The window never moves back, so only the turns from its start are needed.
+        Nor does it move past the turns the summary covers, so no turn is left
+        out of both; bring the summary up to `next_start` first.
+
+        Args:
+            turns: The (question, answer) pairs of the chat from `window.start` on,
+                oldest first.
+            question: The new question.
+            window: The window used for the previous question of the chat.
+            summary: The latest summary of the oldest turns.
+        """
+        start = min(self.next_start(turns, question, window, summary), summary.turns)
+        start = max(start - window.start, 0)
+        if start:
+            window = ContextWindow(start=window.start + start, summary=summary.text)
+
+        messages = [self.system_message(window.summary)]
+        for previous_question, answer in turns[start:]:
+            messages.extend(turn_messages(previous_question, answer))
+        messages.append({"role": "user", "content": question})
+        return messages, window
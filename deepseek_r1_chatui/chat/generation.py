@@ -0,0 +1,135 @@
+"""Stoppable generations.
+
+Each answer being generated runs as a task registered under the client's
+token, so it can be stopped from another event, and is stopped by a watchdog
+when the client disconnects. Cancelling the task closes the HTTP stream to
+Ollama (which then stops generating) and releases the scheduler and model
+slots it holds.
+
+The registry lives in the server process, which assumes a single backend
+worker, as the app's other in-process state does.
+"""
+
+import asyncio
+import functools
+import time
+from typing import Callable, Container, Coroutine, Optional
+
+# How often running generations check that their client is still connected.
+WATCH_INTERVAL = 1.0
+
+# How long a client may be gone (e.g. while reconnecting) before its
+# generations are stopped.
+DISCONNECT_GRACE = 5.0
+
+STOPPED = "stopped"
+DISCONNECTED = "disconnected"
+
+
+@functools.cache
+def _app():
+    from reflex.utils import prerequisites
+
+    return prerequisites.get_and_validate_app().app
+
+
+def _connected_tokens() -> Optional[Container[str]]:
+    """The tokens of the connected clients, or None if they can't be known.
+
+    This relies on Reflex internals; if they change, clients are assumed to
+    stay connected rather than having their generations stopped.
+    """
+    try:
+        namespace = _app().event_namespace
+        return None if namespace is None else namespace.token_to_sid
+    except Exception:
+        return None
+
+
+_last_seen: dict[str, float] = {}
+
+
+def client_connected(token: str) -> bool:
+    """Whether the client with this token has an open websocket."""
+    tokens = _connected_tokens()
+    if tokens is None:
+        return True
+    now = time.monotonic()
+    if token in tokens:
+        _last_seen[token] = now
+        return True
+    if now - _last_seen.setdefault(token, now) < DISCONNECT_GRACE:
+        return True
+    del _last_seen[token]
+    return False
+
+
+class Generations:
+    """The running generation of every client."""
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._reasons: dict[asyncio.Task, str] = {}
+
+    async def run(
+        self,
+        token: str,
+        coro: Coroutine,
+        is_connected: Optional[Callable[[], bool]] = None,
+    ) -> Optional[str]:
+        """Run a generation until it finishes or is stopped.
+
+        Args:
+            token: The client the generation belongs to.
+            coro: The generation.
+            is_connected: Whether the client is still there; the generation is
+                stopped once it isn't.
+
+        Returns:
+            Why the generation was stopped, or None if it finished.
+        """
+        task = asyncio.create_task(coro)
+        self._tasks[token] = task
+        watchdog = (
+            asyncio.create_task(self._watch(token, task, is_connected))
+            if is_connected
+            else None
+        )
+        try:
+            # Waiting instead of awaiting the task keeps its cancellation from
+            # looking like a cancellation of the caller.
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            if self._tasks.get(token) is task:
+                del self._tasks[token]
+        reason = self._reasons.pop(task, None)
+        if task.cancelled():
+            return reason or STOPPED
+        task.result()
+        return None
+
+    def stop(self, token: str, reason: str = STOPPED) -> bool:
+        """Stop the generation of a client, returning whether one was running."""
+        task = self._tasks.get(token)
+        if task is None or task.done():
+            return False
+        self._reasons[task] = reason
+        task.cancel()
+        return True
+
+    async def _watch(
+        self, token: str, task: asyncio.Task, is_connected: Callable[[], bool]
+    ):
+        while not task.done():
+            await asyncio.sleep(WATCH_INTERVAL)
+            if not is_connected():
+                self.stop(token, DISCONNECTED)
+                return
+
+
+generations = Generations()
@@ -0,0 +1,135 @@
+"""Admission control and fair scheduling of requests to Ollama.
+
+A single Ollama server only runs a few requests well at once; beyond that
+every stream slows down together. All requests go through `scheduler`, which
+runs at most `OLLAMA_MAX_CONCURRENT` of them and queues the rest per session.
+Sessions are admitted round-robin, so a session sending many requests can't
+starve the others. Requests are refused once `OLLAMA_MAX_QUEUED` are waiting
+or after waiting `OLLAMA_QUEUE_TIMEOUT` seconds, which keeps the wait bounded
+under load.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+MAX_CONCURRENT = int(os.getenv("OLLAMA_MAX_CONCURRENT", "2"))
+MAX_QUEUED = int(os.getenv("OLLAMA_MAX_QUEUED", "32"))
+QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "120"))
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request is refused, or has waited too long."""
+
+
+@dataclass(eq=False)
+class _Ticket:
+    session: str
+    admitted: bool = False
+
+
+class Scheduler:
+    """Runs a limited number of requests at once, admitting sessions in turn."""
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        max_queued: int = MAX_QUEUED,
+        timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.running = 0
+        # The waiting requests of every session, in the order sessions take turns.
+        self._waiting: OrderedDict[str, deque[_Ticket]] = OrderedDict()
+        self._changed = asyncio.Event()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    def position(self, ticket: _Ticket) -> int:
+        """The 1-based place of a waiting request in the admission order."""
+        depth = self._waiting[ticket.session].index(ticket)
+        ahead = 0
+        before = True
+        for session, queue in self._waiting.items():
+            if session == ticket.session:
+                before = False
+            # Each session gets `depth` turns before this request's turn comes,
+            # and the sessions ahead in the order get one more.
+            ahead += min(len(queue), depth + (1 if before else 0))
+        return ahead + 1
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrent and self._waiting:
+            session, queue = next(iter(self._waiting.items()))
+            queue.popleft().admitted = True
+            self.running += 1
+            if queue:
+                self._waiting.move_to_end(session)
+            else:
+                del self._waiting[session]
+        # Wake the waiting requests so they can report their new positions.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _leave(self, ticket: _Ticket) -> None:
+        if ticket.admitted:
+            self.running -= 1
+        else:
+            queue = self._waiting[ticket.session]
+            queue.remove(ticket)
+            if not queue:
+                del self._waiting[ticket.session]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        session: str,
+        on_wait: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> AsyncIterator[None]:
+        """Wait for a turn to send a request to Ollama.
+
+        Args:
+            session: The session the request belongs to.
+            on_wait: Called with the queue position whenever it changes, and
+                with 0 once the request is admitted.
+
+        Raises:
+            SchedulerBusy: If the queue is full, or the wait timed out.
+        """
+        if self.queued >= self.max_queued:
+            raise SchedulerBusy("The server is busy, please try again in a moment.")
+        ticket = _Ticket(session)
+        self._waiting.setdefault(session, deque()).append(ticket)
+        self._dispatch()
+        try:
+            deadline = time.monotonic() + self.timeout
+            position = None
+            while not ticket.admitted:
+                changed = self._changed
+                if on_wait and self.position(ticket) != position:
+                    position = self.position(ticket)
+                    await on_wait(position)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SchedulerBusy("Timed out waiting for the model, try again.")
+                try:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            if on_wait and position is not None:
+                await on_wait(0)
+            yield
+        finally:
+            self._leave(ticket)
+
+
+scheduler = Scheduler()
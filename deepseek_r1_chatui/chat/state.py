@@ -1,119 +1,497 @@
 import asyncio
-from typing import AsyncGenerator
+import functools
+import os
+import uuid
+from contextlib import aclosing
+
 import reflex as rx
 from ollama import AsyncClient
-from langchain.prompts import PromptTemplate
+
+from chat.compare import COMPARE_MODELS, fan_out
+from chat.context import (
+    NUM_CTX,
+    SUMMARY_MAX_TOKENS,
+    ContextBuilder,
+    Summary,
+    strip_thinking,
+    summary_messages,
+)
+from chat.generation import DISCONNECTED, client_connected, generations
+from chat.scheduler import scheduler
+from chat.store import (
+    DEFAULT_CHAT,
+    PAGE_SIZE,
+    ModelStats,
+    StoredMessage,
+    chat_store,
+)
+from chat.streaming import StreamBuffer
 
 ollama_client = AsyncClient()
 
+MODEL = "deepseek-r1:1.5b"
+
+# How long Ollama keeps the model (and its prompt cache) loaded between requests.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+context_builder = ContextBuilder()
+
 
 class QA(rx.Base):
     """A question and answer pair."""
 
     question: str
     answer: str
+    # False if the answer was stopped before it was finished.
+    complete: bool = True
+
+
+class ModelAnswer(rx.Base):
+    """A model's answer in comparison mode, and how fast it came."""
+
+    model: str
+    answer: str = ""
+    queue_position: int = 0
+    done: bool = False
+    error: str = ""
+    ttft_ms: int = 0
+    tokens_per_s: float = 0.0
+    total_ms: int = 0
+
+
+class ModelMetrics(rx.Base):
+    """The average metrics of a model over its comparison runs."""
+
+    model: str
+    runs: int
+    ttft_ms: int
+    tokens_per_s: float
+    total_ms: int
+
+
+def to_qas(messages: list[StoredMessage]) -> list[QA]:
+    return [
+        QA(question=m.question, answer=m.answer, complete=m.complete) for m in messages
+    ]
+
+
+def to_metrics(stats: list[ModelStats]) -> list[ModelMetrics]:
+    return [
+        ModelMetrics(
+            model=s.model,
+            runs=s.runs,
+            ttft_ms=s.ttft_ms,
+            tokens_per_s=s.tokens_per_s,
+            total_ms=s.total_ms,
+        )
+        for s in stats
+    ]
+
 
+async def update_summary(user_id: str, chat_name: str, window_start: int):
+    """Fold the turns that left the context window into the chat's summary."""
+    _, summary = await asyncio.to_thread(chat_store.context, user_id, chat_name)
+    if summary.turns >= window_start:
+        return
+    turns = await asyncio.to_thread(
+        chat_store.turns, user_id, chat_name, summary.turns, window_start
+    )
 
-DEFAULT_CHATS = {
-    "Intros": [],
-}
+    async with scheduler.slot(user_id):
+        # Without thinking, the whole token budget goes to the summary itself.
+        response = await ollama_client.chat(
+            model=MODEL,
+            messages=summary_messages(summary, turns),
+            think=False,
+            keep_alive=KEEP_ALIVE,
+            options={"num_ctx": NUM_CTX, "num_predict": SUMMARY_MAX_TOKENS},
+        )
+    text = strip_thinking(response["message"]["content"])
+    if not text:
+        # Saving it would drop the turns from the context with nothing in
+        # their place.
+        raise RuntimeError("The model returned an empty summary")
+    await asyncio.to_thread(
+        chat_store.save_summary,
+        user_id,
+        chat_name,
+        Summary(text=text, turns=window_start),
+    )
+
+
+# The summary being brought up to date for each (user, chat), if any.
+_summary_tasks: dict[tuple[str, str], asyncio.Task] = {}
+
+
+def _forget_summary(key: tuple[str, str], task: asyncio.Task) -> None:
+    if _summary_tasks.get(key) is task:
+        del _summary_tasks[key]
+    if not task.cancelled():
+        # A failed summary is retried by the next question that needs it.
+        task.exception()
+
+
+def start_summary(user_id: str, chat_name: str, window_start: int) -> asyncio.Task:
+    """Bring a chat's summary up to `window_start` in a background task.
+
+    Summaries of the same chat run one after the other, each starting from
+    the previous one.
+    """
+    key = (user_id, chat_name)
+    previous = _summary_tasks.get(key)
+
+    async def run():
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await update_summary(user_id, chat_name, window_start)
+
+    task = asyncio.create_task(run())
+    _summary_tasks[key] = task
+    task.add_done_callback(functools.partial(_forget_summary, key))
+    return task
+
+
+async def prepare_summary(user_id: str, chat_name: str) -> None:
+    """Start summarizing the turns the window will drop, once it is close to
+    full, so the next questions don't wait for it."""
+    window, summary = await asyncio.to_thread(chat_store.context, user_id, chat_name)
+    turns = await asyncio.to_thread(chat_store.turns, user_id, chat_name, window.start)
+    start = context_builder.summary_start(turns, window, summary)
+    if start > summary.turns:
+        start_summary(user_id, chat_name, start)
 
 
 class State(rx.State):
     """The app state."""
 
-    chats: dict[str, list[QA]] = DEFAULT_CHATS
-    current_chat: str = "Intros"
+    # Identifies the chats of this browser in the chat store.
+    user_id: str = rx.LocalStorage("", name="chat_user_id")
+    chat_titles: list[str] = [DEFAULT_CHAT]
+    current_chat: str = DEFAULT_CHAT
+    # The loaded messages of the current chat, oldest first.
+    messages: list[QA] = []
+    # Whether the current chat has messages older than the loaded ones.
+    has_older_messages: bool = False
+    _oldest_message_id: int | None = None
     question: str = ""
     processing: bool = False
     new_chat_name: str = ""
+    # Whether the model is loaded in Ollama.
+    model_loaded: bool = False
+    # Prompt tokens Ollama had to evaluate for the last question (the rest came
+    # from its cache), and how long that took.
+    prompt_eval_tokens: int = 0
+    prompt_eval_ms: int = 0
+    # The question being answered, and the answer streamed so far.
+    streaming_chat: str = ""
+    streaming_question: str = ""
+    streaming_answer: str = ""
+    # The place of the question in the scheduler queue, 0 once it is running.
+    queue_position: int = 0
+    # In comparison mode a question is sent to every selected model at once.
+    compare_mode: bool = False
+    compare_models: list[str] = COMPARE_MODELS
+    selected_models: list[str] = COMPARE_MODELS
+    comparison_question: str = ""
+    comparison: list[ModelAnswer] = []
+    model_stats: list[ModelMetrics] = []
+
+    def _load_latest_messages(self):
+        """Load the latest page of messages of the current chat."""
+        stored = chat_store.messages(self.user_id, self.current_chat)
+        self.messages = to_qas(stored)
+        self._oldest_message_id = stored[0].id if stored else None
+        self.has_older_messages = len(stored) == PAGE_SIZE
+
+    def load_chats(self):
+        """Load the chat titles and the latest messages of the current chat."""
+        if not self.user_id:
+            self.user_id = uuid.uuid4().hex
+        titles = chat_store.titles(self.user_id)
+        if not titles:
+            chat_store.create_chat(self.user_id, DEFAULT_CHAT)
+            titles = [DEFAULT_CHAT]
+        self.chat_titles = titles
+        if self.current_chat not in titles:
+            self.current_chat = titles[0]
+        self._load_latest_messages()
+
+    def load_older_messages(self):
+        """Load the page of messages before the loaded ones."""
+        if not self.has_older_messages:
+            return
+        stored = chat_store.messages(
+            self.user_id, self.current_chat, before_id=self._oldest_message_id
+        )
+        self.messages = to_qas(stored) + self.messages
+        if stored:
+            self._oldest_message_id = stored[0].id
+        self.has_older_messages = len(stored) == PAGE_SIZE
 
     def create_chat(self):
         """Create a new chat."""
         if self.new_chat_name.strip():
+            chat_store.create_chat(self.user_id, self.new_chat_name)
+            if self.new_chat_name not in self.chat_titles:
+                self.chat_titles.append(self.new_chat_name)
             self.current_chat = self.new_chat_name
-            self.chats[self.new_chat_name] = []
             self.new_chat_name = ""
+            self._load_latest_messages()
 
     def delete_chat(self):
         """Delete the current chat."""
-        del self.chats[self.current_chat]
-        if len(self.chats) == 0:
-            self.chats = DEFAULT_CHATS
-        self.current_chat = list(self.chats.keys())[0]
+        chat_store.delete_chat(self.user_id, self.current_chat)
+        self.current_chat = ""
+        self.load_chats()
 
     def set_chat(self, chat_name: str):
         """Set the name of the current chat."""
         self.current_chat = chat_name
+        self._load_latest_messages()
+
+    def set_compare_mode(self, enabled: bool):
+        """Turn comparison mode on or off."""
+        self.compare_mode = enabled
+        if enabled:
+            self.model_stats = to_metrics(chat_store.model_stats())
 
-    @rx.var(cache=True)
-    def chat_titles(self) -> list[str]:
-        """Get the list of chat titles."""
-        return list(self.chats.keys())
+    def toggle_model(self, model: str, selected: bool):
+        """Select or deselect a model for comparison."""
+        if selected and model not in self.selected_models:
+            self.selected_models.append(model)
+        elif not selected and model in self.selected_models:
+            self.selected_models.remove(model)
 
-    def _get_chat_history(self) -> str:
-        """Get formatted chat history for the current chat."""
-        history = []
-        for qa in self.chats[self.current_chat][:-1]:  # Exclude the current question
-            history.extend([f"Human: {qa.question}", f"Assistant: {qa.answer}"])
-        return "\n".join(history)
+    def submit_question(self, form_data: dict[str, str]):
+        """Answer a question with the chat model, or compare the selected models."""
+        if self.compare_mode:
+            return State.compare_question(form_data)
+        return State.process_question(form_data)
+
+    def stop_generation(self):
+        """Stop the answer being generated."""
+        generations.stop(self.router.session.client_token)
+
+    @rx.event(background=True)
+    async def load_model(self):
+        """Load the model in Ollama ahead of the first question."""
+        try:
+            running = await ollama_client.ps()
+            loaded = any(model["name"] == MODEL for model in running["models"])
+            if not loaded:
+                # An empty prompt only loads the model.
+                await ollama_client.generate(
+                    model=MODEL,
+                    prompt="",
+                    keep_alive=KEEP_ALIVE,
+                    options={"num_ctx": NUM_CTX},
+                )
+        except Exception:
+            loaded = False
+        else:
+            loaded = True
+        async with self:
+            self.model_loaded = loaded
 
     @rx.event(background=True)
-    async def process_question(self, form_data: dict[str, str]) -> AsyncGenerator:
+    async def process_question(self, form_data: dict[str, str]):
         """Process a question and get streaming response from Ollama."""
         # Get and validate question
         question = form_data.get("question", "").strip()
         if not question:
             return
 
-        # Add the question to the list of questions
+        # The question and its answer are only added to the chat once the answer
+        # is complete. Until then only `streaming_answer` changes, so each update
+        # sends the new text instead of the whole chat.
         async with self:
-            qa = QA(question=question, answer="")
-            self.chats[self.current_chat].append(qa)
+            user_id = self.user_id
+            chat_name = self.current_chat
+            token = self.router.session.client_token
             self.processing = True
-            yield
-            await asyncio.sleep(0.1)
+            self.streaming_chat = chat_name
+            self.streaming_question = question
+            self.streaming_answer = ""
 
-        try:
-            # Create prompt template
-            prompt_template = PromptTemplate(
-                input_variables=["chat_history", "question"],
-                template="""You are a helpful AI assistant. Use the following chat history and question to provide a helpful response:
+        async def on_wait(position: int):
+            async with self:
+                self.queue_position = position
 
-                Chat History:
-                {chat_history}
+        buffer = StreamBuffer()
 
-                Current Question: {question}
+        async def generate(messages: list[dict]):
+            # Wait for a turn, then stream the response from Ollama.
+            async with scheduler.slot(user_id, on_wait):
+                async with aclosing(
+                    await ollama_client.chat(
+                        model=MODEL,
+                        messages=messages,
+                        stream=True,
+                        keep_alive=KEEP_ALIVE,
+                        options={"num_ctx": NUM_CTX},
+                    )
+                ) as stream:
+                    async for chunk in stream:
+                        text = buffer.add(chunk["message"]["content"])
+                        if text:
+                            async with self:
+                                self.streaming_answer += text
+                        if chunk["done"]:
+                            async with self:
+                                self.model_loaded = True
+                                self.prompt_eval_tokens = (
+                                    chunk.get("prompt_eval_count") or 0
+                                )
+                                self.prompt_eval_ms = (
+                                    chunk.get("prompt_eval_duration") or 0
+                                ) // 1_000_000
 
-                Please provide a detailed and helpful response.""",
+        answer, stopped = None, None
+        try:
+            window, summary = await asyncio.to_thread(
+                chat_store.context, user_id, chat_name
             )
+            turns = await asyncio.to_thread(
+                chat_store.turns, user_id, chat_name, window.start
+            )
+            # Turns leaving the window are summarized before it moves, so none
+            # is left out of both. That is usually done in the background
+            # already; otherwise the question waits for it.
+            next_start = context_builder.next_start(turns, question, window, summary)
+            if next_start > summary.turns:
+                try:
+                    await asyncio.shield(start_summary(user_id, chat_name, next_start))
+                    _, summary = await asyncio.to_thread(
+                        chat_store.context, user_id, chat_name
+                    )
+                except Exception:
+                    # Without a new summary the window stays where it is.
+                    pass
+            messages, new_window = context_builder.build(
+                turns, question, window, summary
+            )
+            if new_window != window:
+                await asyncio.to_thread(
+                    chat_store.save_window, user_id, chat_name, new_window
+                )
+            # Stopping the generation closes the stream, so Ollama stops
+            # generating, and frees its place in the scheduler.
+            stopped = await generations.run(
+                token,
+                generate(messages),
+                functools.partial(client_connected, token),
+            )
+        except Exception as e:
+            answer = f"Error: {str(e)}"
 
-            # Generate prompt with chat history
-            prompt = prompt_template.format(
-                chat_history=self._get_chat_history(), question=question
+        finally:
+            async with self:
+                if answer is None:
+                    answer = self.streaming_answer + buffer.flush()
+            # A stopped answer is kept as far as it got, marked as incomplete.
+            await asyncio.to_thread(
+                chat_store.add_message,
+                user_id,
+                chat_name,
+                question,
+                answer,
+                stopped is None,
             )
+            async with self:
+                if self.current_chat == chat_name:
+                    self.messages.append(
+                        QA(question=question, answer=answer, complete=stopped is None)
+                    )
+                self.streaming_answer = ""
+                self.queue_position = 0
+                self.processing = False
+            try:
+                await prepare_summary(user_id, chat_name)
+            except Exception:
+                # The next question summarizes what it needs itself.
+                pass
 
-            # Stream response from Ollama
-            async for chunk in await ollama_client.chat(
-                model="deepseek-r1:1.5b",
-                messages=[{"role": "user", "content": prompt}],
-                stream=True,
-            ):
-                async with self:
-                    if "message" in chunk and "content" in chunk["message"]:
-                        self.chats[self.current_chat][-1].answer += chunk["message"][
-                            "content"
-                        ]
-                        self.chats = self.chats
-                        yield
-                        await asyncio.sleep(0.05)
+    @rx.event(background=True)
+    async def compare_question(self, form_data: dict[str, str]):
+        """Stream the answers of every selected model side by side."""
+        question = form_data.get("question", "").strip()
+        if not question:
+            return
 
-        except Exception as e:
-            async with self:
-                self.chats[self.current_chat][-1].answer = f"Error: {str(e)}"
-                self.chats = self.chats
+        async with self:
+            if not self.selected_models:
+                return
+            user_id = self.user_id
+            chat_name = self.current_chat
+            token = self.router.session.client_token
+            models = [m for m in self.compare_models if m in self.selected_models]
+            self.processing = True
+            self.comparison_question = question
+            self.comparison = [ModelAnswer(model=model) for model in models]
 
+        # Every model gets the context the chat model would get. The answers are
+        # not added to the chat, so the chat's context window is left as is.
+        buffers = {model: StreamBuffer() for model in models}
+
+        async def compare(messages: list[dict]):
+            async with aclosing(
+                fan_out(ollama_client, models, messages, KEEP_ALIVE, NUM_CTX, user_id)
+            ) as deltas:
+                async for delta in deltas:
+                    index = models.index(delta.model)
+                    if delta.queue_position >= 0:
+                        async with self:
+                            self.comparison[index].queue_position = delta.queue_position
+                        continue
+                    if not delta.done:
+                        text = buffers[delta.model].add(delta.text)
+                        if text:
+                            async with self:
+                                self.comparison[index].answer += text
+                        continue
+                    if not delta.error:
+                        await asyncio.to_thread(
+                            chat_store.record_metrics,
+                            delta.model,
+                            delta.ttft_ms,
+                            delta.tokens_per_s,
+                            delta.total_ms,
+                        )
+                    async with self:
+                        result = self.comparison[index]
+                        result.answer += buffers[delta.model].flush()
+                        result.done = True
+                        result.error = delta.error
+                        result.ttft_ms = delta.ttft_ms
+                        result.tokens_per_s = delta.tokens_per_s
+                        result.total_ms = delta.total_ms
+
+        error = None
+        try:
+            window, summary = await asyncio.to_thread(
+                chat_store.context, user_id, chat_name
+            )
+            turns = await asyncio.to_thread(
+                chat_store.turns, user_id, chat_name, window.start
+            )
+            messages, _ = context_builder.build(turns, question, window, summary)
+            # Stopping cancels the streams of every model.
+            stopped = await generations.run(
+                token,
+                compare(messages),
+                functools.partial(client_connected, token),
+            )
+            if stopped:
+                error = "Stopped" if stopped != DISCONNECTED else "Disconnected"
+        except Exception as e:
+            error = str(e)
         finally:
+            stats = await asyncio.to_thread(chat_store.model_stats)
             async with self:
+                for result in self.comparison:
+                    if not result.done:
+                        result.answer += buffers[result.model].flush()
+                        result.done = True
+                        result.error = error or "Stopped"
+                self.model_stats = to_metrics(stats)
                 self.processing = False
-                yield
@@ -0,0 +1,278 @@
+"""SQLite storage for chats and their messages.
+
+Chats are stored per browser (identified by an id kept in local storage), so
+they survive server restarts and expired sessions. The app state only holds
+the chat titles and the messages of the open chat that have been loaded,
+which keeps its size independent of the total history.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from chat.context import ContextWindow, Summary
+
+CHATS_DB = os.getenv("CHATS_DB", "chats.db")
+
+# Messages loaded at once when a chat is opened or scrolled back.
+PAGE_SIZE = 20
+
+DEFAULT_CHAT = "Intros"
+
+
+@dataclass
+class StoredMessage:
+    """A question and its answer, as stored."""
+
+    id: int
+    question: str
+    answer: str
+    # False if the answer was stopped before it was finished.
+    complete: bool = True
+
+
+@dataclass
+class ModelStats:
+    """Average metrics of a model over its recorded runs."""
+
+    model: str
+    runs: int
+    ttft_ms: int
+    tokens_per_s: float
+    total_ms: int
+
+
+class ChatStore:
+    """Chats and messages of every user, in a WAL-mode SQLite database."""
+
+    def __init__(self, path: str = CHATS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chats (
+                    id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    window_start INTEGER NOT NULL DEFAULT 0,
+                    window_summary TEXT NOT NULL DEFAULT '',
+                    summary TEXT NOT NULL DEFAULT '',
+                    summary_turns INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (user_id, title)
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    chat_id INTEGER NOT NULL
+                        REFERENCES chats (id) ON DELETE CASCADE,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    complete INTEGER NOT NULL DEFAULT 1
+                );
+                CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (chat_id, id);
+                CREATE TABLE IF NOT EXISTS model_metrics (
+                    id INTEGER PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    ttft_ms INTEGER NOT NULL,
+                    tokens_per_s REAL NOT NULL,
+                    total_ms INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                """
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(messages)")]
+            if "complete" not in columns:
+                conn.execute(
+                    "ALTER TABLE messages "
+                    "ADD COLUMN complete INTEGER NOT NULL DEFAULT 1"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        """A connection for the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _chat_id(self, user_id: str, title: str) -> Optional[int]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT id FROM chats WHERE user_id = ? AND title = ?",
+                (user_id, title),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def titles(self, user_id: str) -> List[str]:
+        """The titles of a user's chats, oldest first."""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT title FROM chats WHERE user_id = ? ORDER BY created_at, id",
+                (user_id,),
+            )
+            .fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def create_chat(self, user_id: str, title: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO chats (user_id, title, created_at) "
+                "VALUES (?, ?, ?)",
+                (user_id, title, time.time()),
+            )
+
+    def delete_chat(self, user_id: str, title: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM chats WHERE user_id = ? AND title = ?", (user_id, title)
+            )
+
+    def add_message(
+        self,
+        user_id: str,
+        title: str,
+        question: str,
+        answer: str,
+        complete: bool = True,
+    ) -> int:
+        """Append a message to a chat, creating the chat if needed."""
+        self.create_chat(user_id, title)
+        with self._connect() as conn:
+            return conn.execute(
+                "INSERT INTO messages (chat_id, question, answer, created_at, "
+                "complete) VALUES (?, ?, ?, ?, ?)",
+                (
+                    self._chat_id(user_id, title),
+                    question,
+                    answer,
+                    time.time(),
+                    complete,
+                ),
+            ).lastrowid
+
+    def messages(
+        self,
+        user_id: str,
+        title: str,
+        before_id: Optional[int] = None,
+        limit: int = PAGE_SIZE,
+    ) -> List[StoredMessage]:
+        """The latest messages of a chat older than `before_id`, oldest first."""
+        rows = (
+            self._connect()
+            .execute(
+                """
+                SELECT id, question, answer, complete FROM messages
+                WHERE chat_id = ? AND id < ?
+                ORDER BY id DESC LIMIT ?
+                """,
+                (
+                    self._chat_id(user_id, title),
+                    before_id if before_id is not None else 2**63 - 1,
+                    limit,
+                ),
+            )
+            .fetchall()
+        )
+        return [
+            StoredMessage(id, question, answer, bool(complete))
+            for id, question, answer, complete in reversed(rows)
+        ]
+
+    def turns(
+        self, user_id: str, title: str, start: int = 0, end: Optional[int] = None
+    ) -> List[Tuple[str, str]]:
+        """The (question, answer) pairs of a chat from index `start` to `end`."""
+        limit = -1 if end is None else max(end - start, 0)
+        return (
+            self._connect()
+            .execute(
+                "SELECT question, answer FROM messages WHERE chat_id = ? "
+                "ORDER BY id LIMIT ? OFFSET ?",
+                (self._chat_id(user_id, title), limit, start),
+            )
+            .fetchall()
+        )
+
+    def context(self, user_id: str, title: str) -> Tuple[ContextWindow, Summary]:
+        """The context window and summary of a chat."""
+        row = (
+            self._connect()
+            .execute(
+                "SELECT window_start, window_summary, summary, summary_turns "
+                "FROM chats WHERE user_id = ? AND title = ?",
+                (user_id, title),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return ContextWindow(), Summary()
+        return ContextWindow(start=row[0], summary=row[1]), Summary(
+            text=row[2], turns=row[3]
+        )
+
+    def save_window(self, user_id: str, title: str, window: ContextWindow) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE chats SET window_start = ?, window_summary = ? "
+                "WHERE user_id = ? AND title = ?",
+                (window.start, window.summary, user_id, title),
+            )
+
+    def save_summary(self, user_id: str, title: str, summary: Summary) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE chats SET summary = ?, summary_turns = ? "
+                "WHERE user_id = ? AND title = ?",
+                (summary.text, summary.turns, user_id, title),
+            )
+
+    def record_metrics(
+        self, model: str, ttft_ms: int, tokens_per_s: float, total_ms: int
+    ) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO model_metrics "
+                "(model, ttft_ms, tokens_per_s, total_ms, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (model, ttft_ms, tokens_per_s, total_ms, time.time()),
+            )
+
+    def model_stats(self) -> List[ModelStats]:
+        """Average metrics of every measured model, fastest generation first."""
+        rows = (
+            self._connect()
+            .execute(
+                """
+                SELECT model, COUNT(*), AVG(ttft_ms), AVG(tokens_per_s), AVG(total_ms)
+                FROM model_metrics GROUP BY model ORDER BY AVG(tokens_per_s) DESC
+                """
+            )
+            .fetchall()
+        )
+        return [
+            ModelStats(
+                model=model,
+                runs=runs,
+                ttft_ms=int(ttft_ms),
+                tokens_per_s=round(tokens_per_s, 1),
+                total_ms=int(total_ms),
+            )
+            for model, runs, ttft_ms, tokens_per_s, total_ms in rows
+        ]
+
+
+chat_store = ChatStore()
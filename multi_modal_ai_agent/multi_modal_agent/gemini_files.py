@@ -0,0 +1,147 @@
+"""Videos uploaded to the Gemini File API, reused across questions.
+
+Uploads go through the API's resumable protocol in `CHUNK_SIZE` chunks, so
+progress can be reported and the file is never read into memory at once.
+Gemini then processes the video; its state is polled with exponential backoff.
+
+Uploaded files are kept in a registry keyed by the SHA-256 of the video, and
+reused until shortly before Gemini deletes them (48 hours after the upload),
+so follow-up questions about a video don't upload it again. The registry is
+per process.
+"""
+
+import asyncio
+import mimetypes
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+import google.generativeai as genai
+import httpx
+
+UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+
+# The API requires chunks to be a multiple of 256 KiB, except the last.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Seconds between state checks while Gemini processes a video, doubling from
+# the first to the last, and the longest processing may take.
+POLL_INITIAL = 1.0
+POLL_MAX = 16.0
+PROCESSING_TIMEOUT = 10 * 60
+
+# Files are no longer reused this long before they expire.
+EXPIRY_MARGIN = timedelta(minutes=30)
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+async def upload_video(
+    path: str, on_progress: Optional[ProgressCallback] = None
+) -> str:
+    """Upload a video in chunks, returning the name of the Gemini file."""
+    size = os.path.getsize(path)
+    mime_type = mimetypes.guess_type(path)[0] or "video/mp4"
+    async with httpx.AsyncClient(
+        headers={"x-goog-api-key": os.environ["GOOGLE_API_KEY"]},
+        timeout=httpx.Timeout(60, connect=10),
+    ) as client:
+        start = await client.post(
+            UPLOAD_URL,
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(size),
+                "X-Goog-Upload-Header-Content-Type": mime_type,
+            },
+            json={"file": {"display_name": os.path.basename(path)}},
+        )
+        start.raise_for_status()
+        upload_url = start.headers["x-goog-upload-url"]
+
+        offset = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                last = offset + len(chunk) >= size
+                response = await client.post(
+                    upload_url,
+                    content=chunk,
+                    headers={
+                        "X-Goog-Upload-Command": "upload, finalize"
+                        if last
+                        else "upload",
+                        "X-Goog-Upload-Offset": str(offset),
+                    },
+                )
+                response.raise_for_status()
+                offset += len(chunk)
+                if on_progress is not None:
+                    await on_progress(offset, size)
+                if last:
+                    return response.json()["file"]["name"]
+
+
+async def wait_until_active(name: str):
+    """The Gemini file once processed, polling its state with backoff."""
+    deadline = time.monotonic() + PROCESSING_TIMEOUT
+    delay = POLL_INITIAL
+    while True:
+        video_file = await asyncio.to_thread(genai.get_file, name)
+        if video_file.state.name != "PROCESSING":
+            break
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError("Gemini took too long to process the video")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLL_MAX)
+    if video_file.state.name != "ACTIVE":
+        raise RuntimeError(
+            f"Gemini could not process the video ({video_file.state.name})"
+        )
+    return video_file
+
+
+def _expired(video_file) -> bool:
+    expires = video_file.expiration_time
+    return expires is None or expires - EXPIRY_MARGIN <= datetime.now(timezone.utc)
+
+
+class FileRegistry:
+    """Gemini files by video digest; concurrent requests share one upload."""
+
+    def __init__(self):
+        self._uploads: dict[str, asyncio.Task] = {}
+
+    def _reusable(self, task: asyncio.Task) -> bool:
+        if not task.done():
+            return True
+        return (
+            not task.cancelled()
+            and task.exception() is None
+            and not _expired(task.result())
+        )
+
+    async def _upload(self, path: str, on_progress: Optional[ProgressCallback]):
+        return await wait_until_active(await upload_video(path, on_progress))
+
+    async def get(
+        self,
+        digest: str,
+        path: str,
+        on_progress: Optional[ProgressCallback] = None,
+    ):
+        """The active Gemini file of a video, uploading it if needed.
+
+        `on_progress` is called with the bytes sent and the total, if this
+        request starts the upload.
+        """
+        task = self._uploads.get(digest)
+        if task is None or not self._reusable(task):
+            task = asyncio.create_task(self._upload(path, on_progress))
+            self._uploads[digest] = task
+        # Shielded, so the upload goes on for others if this request is cancelled.
+        return await asyncio.shield(task)
+
+
+video_files = FileRegistry()
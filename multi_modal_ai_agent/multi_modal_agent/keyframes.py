@@ -0,0 +1,142 @@
+"""Keyframes of a video, to answer questions without sending the whole video.
+
+The video is decoded with PyAV in a worker process. `KEYFRAME_SAMPLE_FPS`
+frames a second are compared with the previous sample, and a sample that
+differs from it by at least `KEYFRAME_THRESHOLD` (the mean absolute difference
+of small grayscale copies, from 0 to 1) starts a new scene. The first frame of
+each scene is kept, up to `KEYFRAME_MAX` of the most distinct ones, downscaled
+to at most `KEYFRAME_SIZE` pixels a side.
+
+Keyframes are stored by video digest and settings, so each video is only
+decoded once per configuration.
+"""
+
+import asyncio
+import heapq
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageChops, ImageStat
+
+KEYFRAME_SAMPLE_FPS = float(os.getenv("KEYFRAME_SAMPLE_FPS", "1"))
+KEYFRAME_THRESHOLD = float(os.getenv("KEYFRAME_THRESHOLD", "0.15"))
+KEYFRAME_MAX = int(os.getenv("KEYFRAME_MAX", "24"))
+KEYFRAME_SIZE = int(os.getenv("KEYFRAME_SIZE", "512"))
+KEYFRAME_WORKERS = int(os.getenv("KEYFRAME_WORKERS", "1"))
+
+# Samples are compared at this size, which ignores noise and small motion.
+SIGNATURE_SIZE = (64, 36)
+
+
+@dataclass
+class Keyframe:
+    # Seconds from the start of the video.
+    timestamp: float
+    path: str
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _signature(image: Image.Image) -> Image.Image:
+    return image.convert("L").resize(SIGNATURE_SIZE)
+
+
+def _difference(a: Image.Image, b: Image.Image) -> float:
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0] / 255
+
+
+def extract_keyframes(
+    path: str,
+    out_dir: str,
+    digest: str,
+    sample_fps: float = KEYFRAME_SAMPLE_FPS,
+    threshold: float = KEYFRAME_THRESHOLD,
+    max_frames: int = KEYFRAME_MAX,
+    size: int = KEYFRAME_SIZE,
+) -> list[Keyframe]:
+    """Detect scene changes in a video and save their first frames, or reuse them."""
+    import av
+
+    out = Path(out_dir) / digest / f"{sample_fps:g}-{threshold:g}-{max_frames}-{size}"
+    manifest = out / "keyframes.json"
+    if manifest.exists():
+        return [Keyframe(**k) for k in json.loads(manifest.read_text())]
+
+    # The most distinct scene starts, as (difference, timestamp, image); the
+    # first frame always counts as one.
+    scenes: list[tuple[float, float, Image.Image]] = []
+    previous: Optional[Image.Image] = None
+    next_sample = 0.0
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        for frame in container.decode(stream):
+            if frame.time is None or frame.time < next_sample:
+                continue
+            next_sample = frame.time + 1 / sample_fps
+            image = frame.to_image()
+            signature = _signature(image)
+            score = 1.0 if previous is None else _difference(previous, signature)
+            previous = signature
+            if score < threshold:
+                continue
+            image.thumbnail((size, size))
+            entry = (score, frame.time, image)
+            if len(scenes) < max_frames:
+                heapq.heappush(scenes, entry)
+            else:
+                heapq.heappushpop(scenes, entry)
+
+    out.mkdir(parents=True, exist_ok=True)
+    keyframes = []
+    for i, (_, timestamp, image) in enumerate(sorted(scenes, key=lambda s: s[1])):
+        frame_path = out / f"frame-{i:03d}.jpg"
+        image.convert("RGB").save(frame_path, quality=85)
+        keyframes.append(Keyframe(timestamp=timestamp, path=str(frame_path)))
+    # Written last, and atomically, so a manifest always has its frames.
+    tmp = manifest.with_suffix(".tmp")
+    tmp.write_text(json.dumps([asdict(k) for k in keyframes]))
+    tmp.replace(manifest)
+    return keyframes
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=KEYFRAME_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def extract_keyframes_async(
+    path: str, out_dir: str, digest: str
+) -> list[Keyframe]:
+    """Extract a video's keyframes in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pool(), extract_keyframes, path, out_dir, digest
+    )
+
+
+def describe_keyframes(keyframes: list[Keyframe]) -> str:
+    times = ", ".join(format_timestamp(k.timestamp) for k in keyframes)
+    return (
+        f"Instead of the video, you are given {len(keyframes)} keyframes from it, "
+        f"one per scene, taken at {times}."
+    )
@@ -1,6 +1,22 @@
 import reflex as rx
 import google.generativeai as genai
-import asyncio
+from PIL import Image
+
+from multi_modal_agent.gemini_files import video_files
+from multi_modal_agent.keyframes import (
+    describe_keyframes,
+    extract_keyframes_async,
+    format_timestamp,
+)
+from multi_modal_agent.uploads import (
+    MAX_VIDEO_BYTES,
+    VIDEO_TYPES,
+    InvalidUpload,
+    save_video,
+)
+
+# Keyframes are stored under the upload directory.
+KEYFRAME_DIR = "keyframes"
 
 
 class State(rx.State):
@@ -9,9 +25,13 @@ class State(rx.State):
     processing: bool = False
     upload_status: str = ""
     result: str = ""
+    # The name the video was uploaded with, and the one it is stored under.
     video_filename: str = ""
+    video_upload: str = ""
     video: str = ""
     question: str = ""
+    use_keyframes: bool = False
+    _video_digest: str = ""
 
     @rx.event
     async def handle_upload(self, files: list[rx.UploadFile]):
@@ -22,19 +42,20 @@ class State(rx.State):
 
         try:
             file = files[0]
-            upload_data = await file.read()
-
-            filename = file.filename
-            outfile = rx.get_upload_dir() / filename
-
-            # Save the file
-            with outfile.open("wb") as file_object:
-                file_object.write(upload_data)
-
-            self.video_filename = filename
-            self.video = outfile
-            self.upload_status = "Video uploaded successfully!"
+            filename, digest, duplicate = await save_video(file, rx.get_upload_dir())
+
+            self.video_filename = file.filename or filename
+            self.video_upload = filename
+            self.video = str(rx.get_upload_dir() / filename)
+            self._video_digest = digest
+            self.upload_status = (
+                "This video was already uploaded; reusing it."
+                if duplicate
+                else "Video uploaded successfully!"
+            )
 
+        except InvalidUpload as e:
+            self.upload_status = str(e)
         except Exception as e:
             self.upload_status = f"Error uploading video: {str(e)}"
 
@@ -54,25 +75,39 @@ class State(rx.State):
         async with self:
             self.processing = True
             self.result = "Analyzing Video..."
-            yield
-            await asyncio.sleep(1)
+            digest, video, question = self._video_digest, str(self.video), self.question
+            use_keyframes = self.use_keyframes
+        yield
+
+        async def show_progress(sent: int, total: int):
+            async with self:
+                if sent < total:
+                    self.result = f"Uploading video... {sent * 100 // total}%"
+                else:
+                    self.result = "Processing video..."
 
         try:
-            client = genai.Client()
-
-            video_file = client.files.upload(file=str(self.video))
-            while video_file.state == "PROCESSING":
-                await asyncio.sleep(2)
-                # time.sleep(2)
-                video_file = client.files.get(name=video_file.name)
-
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[
-                    video_file,
-                    "Describe this video.",
-                ],
-            )
+            if use_keyframes:
+                async with self:
+                    self.result = "Extracting keyframes..."
+                keyframes = await extract_keyframes_async(
+                    video, str(rx.get_upload_dir() / KEYFRAME_DIR), digest
+                )
+                contents = [describe_keyframes(keyframes)]
+                for keyframe in keyframes:
+                    contents += [
+                        f"Frame at {format_timestamp(keyframe.timestamp)}:",
+                        Image.open(keyframe.path),
+                    ]
+            else:
+                # Uploaded once per video; follow-up questions reuse the file.
+                contents = [await video_files.get(digest, video, show_progress)]
+
+            async with self:
+                self.result = "Analyzing Video..."
+
+            model = genai.GenerativeModel("gemini-2.0-flash")
+            response = await model.generate_content_async([*contents, question])
 
             async with self:
                 self.result = response.text
@@ -109,7 +144,10 @@ def index() -> rx.Component:
                         ),
                         class_name="text-center",
                     ),
-                    accept={".mp4", ".mov", ".avi"},
+                    accept={
+                        mime_type: [suffix] for suffix, mime_type in VIDEO_TYPES.items()
+                    },
+                    max_size=MAX_VIDEO_BYTES,
                     max_files=1,
                     class_name="border-2 border-dashed border-gray-300 rounded-lg p-8 bg-gray-50 hover:bg-gray-100 transition-colors",
                     id="upload1",
@@ -131,14 +169,15 @@ def index() -> rx.Component:
             ),
             # Video and Analysis section
             rx.cond(
-                State.video_filename != "",
+                State.video_upload != "",
                 rx.el.div(
                     rx.el.div(
                         rx.video(
-                            url=rx.get_upload_url(State.video_filename),
+                            url=rx.get_upload_url(State.video_upload),
                             controls=True,
                             class_name="w-full rounded-lg shadow-lg",
                         ),
+                        rx.el.p(State.video_filename, class_name="text-gray-600 mt-2"),
                         class_name="mb-6",
                     ),
                     rx.el.textarea(
@@ -147,6 +186,14 @@ def index() -> rx.Component:
                         on_change=State.set_question,
                         class_name="w-full p-4 border-2 border-gray-300 rounded-lg focus:border-blue-600 focus:ring-1 focus:ring-blue-600 h-32 resize-none",
                     ),
+                    rx.el.label(
+                        rx.checkbox(
+                            checked=State.use_keyframes,
+                            on_change=State.set_use_keyframes,
+                        ),
+                        "Send only keyframes (faster for long videos)",
+                        class_name="flex items-center gap-2 text-gray-600",
+                    ),
                     rx.el.button(
                         "Analyze & Research",
                         on_click=State.analyze_video,
@@ -1,9 +1,20 @@
 import reflex as rx
-import google.generativeai as genai
 from agno.agent import Agent
+from agno.media import Image
 from agno.models.google import Gemini
 from agno.tools.duckduckgo import DuckDuckGoTools
-import asyncio
+
+from multi_modal_agent.gemini_files import video_files
+from multi_modal_agent.keyframes import describe_keyframes, extract_keyframes_async
+from multi_modal_agent.uploads import (
+    MAX_VIDEO_BYTES,
+    VIDEO_TYPES,
+    InvalidUpload,
+    save_video,
+)
+
+# Keyframes are stored under the upload directory.
+KEYFRAME_DIR = "keyframes"
 
 
 class State(rx.State):
@@ -12,9 +23,13 @@ class State(rx.State):
     processing: bool = False
     upload_status: str = ""
     result: str = ""
+    # The name the video was uploaded with, and the one it is stored under.
     video_filename: str = ""
+    video_upload: str = ""
     video: str = ""
     question: str = ""
+    use_keyframes: bool = False
+    _video_digest: str = ""
 
     async def handle_upload(self, files: list[rx.UploadFile]):
         """Handle video file upload."""
@@ -23,19 +38,20 @@ class State(rx.State):
 
         try:
             file = files[0]
-            upload_data = await file.read()
-
-            filename = file.filename
-            outfile = rx.get_upload_dir() / filename
-
-            # Save the file
-            with outfile.open("wb") as file_object:
-                file_object.write(upload_data)
-
-            self.video_filename = filename
-            self.video = outfile
-            self.upload_status = "Video uploaded successfully!"
+            filename, digest, duplicate = await save_video(file, rx.get_upload_dir())
+
+            self.video_filename = file.filename or filename
+            self.video_upload = filename
+            self.video = str(rx.get_upload_dir() / filename)
+            self._video_digest = digest
+            self.upload_status = (
+                "This video was already uploaded; reusing it."
+                if duplicate
+                else "Video uploaded successfully!"
+            )
 
+        except InvalidUpload as e:
+            self.upload_status = str(e)
         except Exception as e:
             self.upload_status = f"Error uploading video: {str(e)}"
 
@@ -48,8 +64,16 @@ class State(rx.State):
                 return
         async with self:
             self.processing = True
-            yield
-            await asyncio.sleep(1)
+            digest, video, question = self._video_digest, str(self.video), self.question
+            use_keyframes = self.use_keyframes
+        yield
+
+        async def show_progress(sent: int, total: int):
+            async with self:
+                if sent < total:
+                    self.result = f"Uploading video... {sent * 100 // total}%"
+                else:
+                    self.result = "Processing video..."
 
         try:
             agent = Agent(
@@ -59,19 +83,32 @@ class State(rx.State):
                 markdown=True,
             )
 
-            video_file = genai.upload_file(str(self.video))
-            while video_file.state.name == "PROCESSING":
-                await asyncio.sleep(2)
-                # time.sleep(2)
-                video_file = genai.get_file(video_file.name)
-
             prompt = f"""
             First analyze this video and then answer the following question using both
-            the video analysis and web research: {self.question}
+            the video analysis and web research: {question}
             Provide a comprehensive response focusing on practical, actionable information.
             """
 
-            result = agent.run(prompt, videos=[video_file])
+            if use_keyframes:
+                async with self:
+                    self.result = "Extracting keyframes..."
+                keyframes = await extract_keyframes_async(
+                    video, str(rx.get_upload_dir() / KEYFRAME_DIR), digest
+                )
+                media = {
+                    "images": [Image(filepath=keyframe.path) for keyframe in keyframes]
+                }
+                prompt = f"{describe_keyframes(keyframes)}\n{prompt}"
+            else:
+                # Uploaded once per video; follow-up questions reuse the file.
+                media = {
+                    "videos": [await video_files.get(digest, video, show_progress)]
+                }
+
+            async with self:
+                self.result = "Analyzing Video..."
+
+            result = await agent.arun(prompt, **media)
 
             async with self:
                 self.result = result.content
@@ -103,7 +140,10 @@ def index():
                         ),
                         rx.text("Drag and drop or click to select"),
                     ),
-                    accept={".mp4", ".mov", ".avi"},
+                    accept={
+                        mime_type: [suffix] for suffix, mime_type in VIDEO_TYPES.items()
+                    },
+                    max_size=MAX_VIDEO_BYTES,
                     max_files=1,
                     border="1px dashed",
                     padding="20px",
@@ -123,13 +163,14 @@ def index():
             ),
             # Video and Analysis section
             rx.cond(
-                State.video_filename != "",
+                State.video_upload != "",
                 rx.vstack(
                     rx.video(
-                        url=rx.get_upload_url(State.video_filename),
+                        url=rx.get_upload_url(State.video_upload),
                         width="50%",
                         controls=True,
                     ),
+                    rx.text(State.video_filename),
                     rx.text_area(
                         placeholder="Ask any question related to the video - the AI Agent will analyze it and search the web if needed",
                         value=State.question,
@@ -137,6 +178,11 @@ def index():
                         width="600px",
                         size="2",
                     ),
+                    rx.checkbox(
+                        "Send only keyframes (faster for long videos)",
+                        checked=State.use_keyframes,
+                        on_change=State.set_use_keyframes,
+                    ),
                     rx.button(
                         "Analyze & Research",
                         on_click=State.analyze_video,
@@ -0,0 +1,84 @@
+"""Saving uploaded videos under content-addressed names.
+
+Uploads are checked before they are read: the extension, the declared size
+(at most `MAX_VIDEO_BYTES`) and the container signature in the first bytes.
+The file is then hashed in `CHUNK_SIZE` chunks and saved as `<sha256><ext>`,
+so users never overwrite each other's videos and a video that was already
+uploaded is detected before anything is written. Writes go to a temporary
+file that is renamed into place once complete.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import reflex as rx
+
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_BYTES", str(2 * 1024**3)))
+CHUNK_SIZE = 1024 * 1024
+
+VIDEO_TYPES = {
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+}
+
+# Box types that can start an MP4 or QuickTime file, at bytes 4 to 8.
+ISO_BOXES = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"}
+
+
+class InvalidUpload(ValueError):
+    """An upload that isn't a supported video."""
+
+
+def _is_video(head: bytes, suffix: str) -> bool:
+    if suffix == ".avi":
+        return head[:4] == b"RIFF" and head[8:12] == b"AVI "
+    return head[4:8] in ISO_BOXES
+
+
+def _too_large() -> InvalidUpload:
+    return InvalidUpload(f"The video is larger than {MAX_VIDEO_BYTES // 1024**2} MB.")
+
+
+async def save_video(file: rx.UploadFile, upload_dir: Path) -> tuple[str, str, bool]:
+    """Save an uploaded video.
+
+    Returns its file name, its digest, and whether it was already saved.
+    """
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in VIDEO_TYPES:
+        raise InvalidUpload("Please upload an MP4, MOV or AVI video.")
+    if file.size is not None and file.size > MAX_VIDEO_BYTES:
+        raise _too_large()
+
+    head = await file.read(12)
+    if not _is_video(head, suffix):
+        raise InvalidUpload(f"The file is not a valid {suffix[1:].upper()} video.")
+
+    digest = hashlib.sha256(head)
+    size = len(head)
+    while chunk := await file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_VIDEO_BYTES:
+            raise _too_large()
+        digest.update(chunk)
+
+    filename = f"{digest.hexdigest()}{suffix}"
+    path = upload_dir / filename
+    if path.exists():
+        return filename, digest.hexdigest(), True
+
+    await file.seek(0)
+    partial = upload_dir / f".{filename}.{uuid.uuid4().hex}.part"
+    try:
+        with partial.open("wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                await asyncio.to_thread(out.write, chunk)
+        partial.replace(path)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    return filename, digest.hexdigest(), False
@@ -1,13 +1,17 @@
 import reflex as rx
 import asyncio
-from phi.agent import Agent
-from phi.model.google import Gemini
-from phi.tools.duckduckgo import DuckDuckGo
-import os
-from PIL import Image
+import hashlib
 
-# Set Google API Key from environment
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+from agent.batch import Study, analyze_studies, format_findings, write_report
+from agent.factory import GOOGLE_API_KEY, run_medical_agent
+from agent.preprocess import prepare_async
+from agent.research import prefetch, research_queries, study_subject, with_research
+
+# Derived images live under the upload directory, so previews can be served.
+DERIVED_DIR = "derived"
+
+# The most images that can be uploaded, and analyzed, at once.
+MAX_FILES = 64
 
 
 class MedicalState(rx.State):
@@ -16,8 +20,8 @@ class MedicalState(rx.State):
     processing: bool = False
     upload_status: str = ""
     analysis_result: str = ""
-    image_filename: str = ""
-    _temp_image_path: str = ""
+    preview_filenames: list[str] = []
+    _studies: list[Study] = []
 
     query = """
             You are a highly skilled medical imaging expert with extensive knowledge in radiology and diagnostic imaging. Analyze the patient's medical image and structure your response as follows:
@@ -64,61 +68,95 @@ class MedicalState(rx.State):
             return
 
         try:
-            file = files[0]
-            upload_data = await file.read()
-
-            filename = file.filename
-            outfile = rx.get_upload_dir() / filename
-
-            # Save the file
-            with outfile.open("wb") as file_object:
-                file_object.write(upload_data)
+            upload_dir = rx.get_upload_dir()
+            derived_dir = upload_dir / DERIVED_DIR
+            saved = {}
+            for file in files:
+                upload_data = await file.read()
+
+                # Identical images are only analyzed once.
+                digest = hashlib.sha256(upload_data).hexdigest()
+                if digest in saved:
+                    continue
+                filename = file.filename
+                if filename in (name for name, _ in saved.values()):
+                    filename = f"{digest[:8]}-{filename}"
+                outfile = upload_dir / filename
+
+                # Save the file
+                with outfile.open("wb") as file_object:
+                    file_object.write(upload_data)
+                saved[digest] = (filename, outfile)
+
+            # Decode and resize in the process pool; the uploads are kept as is.
+            prepared = await asyncio.gather(
+                *(
+                    prepare_async(str(outfile), str(derived_dir))
+                    for _, outfile in saved.values()
+                )
+            )
 
-            self.image_filename = filename
-            self._temp_image_path = str(outfile)
-            self.upload_status = "Image uploaded successfully!"
+            self._studies = [
+                Study(
+                    name=name,
+                    frames=[str(derived_dir / f) for f in study.frames],
+                    subject=study_subject(study.modality, study.body_part),
+                )
+                for (name, _), study in zip(saved.values(), prepared)
+            ]
+            self.preview_filenames = [
+                f"{DERIVED_DIR}/{study.thumbnail}" for study in prepared
+            ]
+            self.analysis_result = ""
+            if len(files) == 1:
+                self.upload_status = "Image uploaded successfully!"
+            else:
+                self.upload_status = f"{len(saved)} images uploaded successfully!"
+                if len(saved) < len(files):
+                    self.upload_status += (
+                        f" ({len(files) - len(saved)} duplicates skipped)"
+                    )
 
         except Exception as e:
             self.upload_status = f"Error uploading image: {str(e)}"
 
-    @rx.var
-    def medical_agent(self) -> Agent | None:
-        if GOOGLE_API_KEY:
-            return Agent(
-                model=Gemini(api_key=GOOGLE_API_KEY, id="gemini-2.0-flash-exp"),
-                tools=[DuckDuckGo()],
-                markdown=True,
-            )
-        return None
-
     @rx.event(background=True)
     async def analyze_image(self):
         """Process image using medical AI agent."""
-        if not self.medical_agent:
-            self.analysis_result = "API Key not configured in environment"
+        if not GOOGLE_API_KEY:
+            async with self:
+                self.analysis_result = "API Key not configured in environment"
             return
 
         async with self:
             self.processing = True
             self.analysis_result = ""
-            yield
-            await asyncio.sleep(1)
+            studies = list(self._studies)
+        yield
+
+        # If the subject is known, search the web while the images are analyzed.
+        subject = next((study.subject for study in studies if study.subject), "")
+        queries = research_queries(subject)
+        research = asyncio.create_task(prefetch(queries))
 
         try:
-            # Process image
-            with Image.open(self._temp_image_path) as img:
-                width, height = img.size
-                aspect_ratio = width / height
-                new_width = 500
-                new_height = int(new_width / aspect_ratio)
-                resized_img = img.resize((new_width, new_height))
-                resized_img.save(self._temp_image_path)
-
-            # Run analysis
-            result = self.medical_agent.run(self.query, images=[self._temp_image_path])
+            if len(studies) == 1:
+                frames = studies[0].frames
+                prompt = self.query
+                if len(frames) > 1:
+                    prompt = (
+                        f"The {len(frames)} images are evenly spaced frames of one "
+                        f"study.\n{prompt}"
+                    )
+                # Run analysis with this worker thread's agent
+                result = await asyncio.to_thread(
+                    run_medical_agent, with_research(prompt, queries), frames
+                )
+            else:
+                result = await self._analyze_batch(studies, queries)
 
             async with self:
-                self.analysis_result = result.content
+                self.analysis_result = result
                 self.processing = False
 
         except Exception as e:
@@ -126,8 +164,32 @@ class MedicalState(rx.State):
                 self.processing = False
                 self.analysis_result = f"An error occurred: {str(e)}"
         finally:
-            if os.path.exists(self._temp_image_path):
-                os.remove(self._temp_image_path)
+            # Searches the agent didn't get to aren't worth waiting for.
+            research.cancel()
+
+    async def _analyze_batch(self, studies: list[Study], queries: list[str]) -> str:
+        """Analyze images concurrently, showing the findings as they arrive."""
+        findings = []
+        async for result in analyze_studies(studies):
+            findings.append(result)
+            async with self:
+                self.analysis_result = (
+                    f"**Analyzed {len(findings)} of {len(studies)} images...**\n\n"
+                    + format_findings(findings)
+                )
+
+        async with self:
+            self.analysis_result = (
+                "**Writing the combined report...**\n\n" + format_findings(findings)
+            )
+        report = await write_report(findings, queries)
+
+        failed = [f.study.name for f in findings if f.error is not None]
+        if failed:
+            report += (
+                "\n\n_These images could not be analyzed: " + ", ".join(failed) + "_"
+            )
+        return report
 
 
 def medical_header() -> rx.Component:
@@ -155,22 +217,27 @@ def upload_section() -> rx.Component:
                     rx.el.div(
                         rx.el.i(class_name="fas fa-upload text-3xl text-blue-500 mb-4"),
                         rx.el.p(
-                            "Drop your medical image here",
+                            "Drop your medical images here",
                             class_name="text-lg font-semibold text-gray-700 mb-2",
                         ),
                         rx.el.p(
                             "or click to browse", class_name="text-sm text-gray-500"
                         ),
                         rx.el.p(
-                            "Supported formats: JPG, PNG",
+                            "Supported formats: JPG, PNG, DICOM",
                             class_name="text-xs text-gray-400 mt-2",
                         ),
                         class_name="text-center",
                     ),
                     class_name="p-8 border-2 border-dashed border-blue-200 rounded-xl hover:border-blue-400 transition-colors duration-300",
                 ),
-                max_files=1,
-                accept={".jpg", ".jpeg", ".png"},
+                multiple=True,
+                max_files=MAX_FILES,
+                accept={
+                    "image/jpeg": [".jpg", ".jpeg"],
+                    "image/png": [".png"],
+                    "application/dicom": [".dcm", ".dicom"],
+                },
                 id="medical_upload",
                 class_name="cursor-pointer",
             ),
@@ -182,7 +249,7 @@ def upload_section() -> rx.Component:
                 ),
             ),
             rx.el.button(
-                "Upload Image",
+                "Upload Images",
                 on_click=lambda: MedicalState.handle_upload(
                     rx.upload_files(upload_id="medical_upload")
                 ),
@@ -197,12 +264,25 @@ def upload_section() -> rx.Component:
 def analysis_section() -> rx.Component:
     return rx.el.div(
         rx.cond(
-            MedicalState.image_filename != "",
+            MedicalState.preview_filenames.length() > 0,
             rx.el.div(
                 rx.el.div(
-                    rx.el.img(
-                        src=rx.get_upload_url(MedicalState.image_filename),
-                        class_name="mx-auto my-4 max-w-2xl h-auto rounded-lg shadow-lg border border-gray-200",
+                    rx.cond(
+                        MedicalState.preview_filenames.length() == 1,
+                        rx.el.img(
+                            src=rx.get_upload_url(MedicalState.preview_filenames[0]),
+                            class_name="mx-auto my-4 max-w-2xl h-auto rounded-lg shadow-lg border border-gray-200",
+                        ),
+                        rx.el.div(
+                            rx.foreach(
+                                MedicalState.preview_filenames,
+                                lambda filename: rx.el.img(
+                                    src=rx.get_upload_url(filename),
+                                    class_name="w-full h-24 object-cover rounded-md border border-gray-200",
+                                ),
+                            ),
+                            class_name="grid grid-cols-4 md:grid-cols-6 gap-2 my-4",
+                        ),
                     ),
                     class_name="mb-6",
                 ),
@@ -214,13 +294,21 @@ def analysis_section() -> rx.Component:
                                 class_name="w-8 h-8 border-4 border-blue-500 border-t-transparent rounded-full animate-spin"
                             ),
                             rx.el.p(
-                                "Analyzing image...",
+                                rx.cond(
+                                    MedicalState.preview_filenames.length() == 1,
+                                    "Analyzing image...",
+                                    "Analyzing images...",
+                                ),
                                 class_name="mt-2 text-sm text-gray-600",
                             ),
                             class_name="flex flex-col items-center justify-center p-4",
                         ),
                         rx.el.button(
-                            "Analyze Image",
+                            rx.cond(
+                                MedicalState.preview_filenames.length() == 1,
+                                "Analyze Image",
+                                "Analyze Study",
+                            ),
                             on_click=MedicalState.analyze_image,
                             diabled=MedicalState.processing,
                             class_name="w-full py-2 px-4 bg-gradient-to-r from-blue-500 to-cyan-500 text-white rounded-lg hover:from-blue-600 hover:to-cyan-600 transition-all duration-300 shadow-md hover:shadow-lg",
@@ -0,0 +1,140 @@
+"""Analysis of many images at once, within the model's rate limits.
+
+Each image (or multi-frame study) is analyzed on its own. All sessions share
+one API key, so across the app at most `BATCH_CONCURRENCY` runs are in flight
+and at most `BATCH_REQUESTS_PER_MINUTE` are started per minute. A failed run
+is retried up to `BATCH_RETRIES` times, with exponential backoff and jitter.
+The findings are then combined into one report by a final, text-only run.
+"""
+
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from agent.factory import run_medical_agent
+from agent.research import with_research
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_REQUESTS_PER_MINUTE = float(os.getenv("BATCH_REQUESTS_PER_MINUTE", "15"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "3"))
+# Seconds before the first retry; doubled for every further one.
+BATCH_BACKOFF = float(os.getenv("BATCH_BACKOFF", "2"))
+
+FINDINGS_QUERY = """
+You are a medical imaging expert. This is one image, or a series of frames,
+from a larger study.
+Briefly state the imaging modality, the anatomical region, and the key
+findings with their location, size and severity (Normal/Mild/Moderate/Severe).
+Do not search the web. Answer in a few markdown bullet points.
+"""
+
+REPORT_QUERY = """
+You are a highly skilled medical imaging expert. Below are the findings for
+each image of one study, made separately. Combine them into a single report
+with these sections:
+
+### 1. Study Overview
+### 2. Key Findings (across images, referencing the image names)
+### 3. Diagnostic Assessment
+### 4. Patient-Friendly Explanation
+### 5. Research Context (use the DuckDuckGo search tool, and include 2-3 references)
+
+Format your response using clear markdown headers and bullet points.
+
+{findings}
+"""
+
+
+@dataclass
+class Study:
+    """An uploaded image, and the frames derived from it to analyze."""
+
+    name: str
+    frames: list[str]
+    # What the study shows, if known before the analysis, e.g. "CT chest".
+    subject: str = ""
+
+
+@dataclass
+class Findings:
+    study: Study
+    text: str = ""
+    error: Optional[str] = None
+
+
+class RateLimiter:
+    """Spaces out the start of runs to at most `per_minute` a minute."""
+
+    def __init__(self, per_minute: float = BATCH_REQUESTS_PER_MINUTE):
+        self.interval = 60 / per_minute if per_minute > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+limiter = RateLimiter()
+slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+
+async def run_with_retries(
+    prompt: str, images: Optional[list[str]], retries: int = BATCH_RETRIES
+) -> str:
+    """Run the agent under the limits, retrying failures with backoff."""
+    for attempt in range(retries + 1):
+        try:
+            async with slots:
+                await limiter.wait()
+                return await asyncio.to_thread(run_medical_agent, prompt, images)
+        except Exception:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(BATCH_BACKOFF * 2**attempt * random.uniform(0.5, 1.5))
+
+
+async def analyze_studies(studies: list[Study]) -> AsyncIterator[Findings]:
+    """The findings for each study, in the order the runs finish."""
+
+    async def analyze(study: Study) -> Findings:
+        prompt = FINDINGS_QUERY
+        if len(study.frames) > 1:
+            prompt = f"The images are evenly spaced frames of one series.\n{prompt}"
+        try:
+            text = await run_with_retries(prompt, study.frames)
+            return Findings(study, text=text)
+        except Exception as e:
+            return Findings(study, error=str(e))
+
+    tasks = [asyncio.create_task(analyze(study)) for study in studies]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def format_findings(findings: list[Findings]) -> str:
+    return "\n\n".join(
+        f"#### {f.study.name}\n"
+        + (f.text.strip() if f.error is None else f"_Analysis failed: {f.error}_")
+        for f in findings
+    )
+
+
+async def write_report(findings: list[Findings], queries: list[str]) -> str:
+    """Combine the per-image findings into one report, researching `queries`."""
+    analyzed = [f for f in findings if f.error is None]
+    if not analyzed:
+        raise RuntimeError("None of the images could be analyzed")
+    prompt = REPORT_QUERY.format(findings=format_findings(analyzed))
+    return await run_with_retries(with_research(prompt, queries), None)
@@ -0,0 +1,52 @@
+"""Medical agents, built once per configuration and worker thread.
+
+Building an agent creates a Gemini client and its tools, which is too slow to
+do on every state update. phi agents keep per-run state (memory, the model's
+function list), so one instance can't serve concurrent runs; instead every
+worker thread keeps its own agent for each configuration and reuses it.
+"""
+
+import os
+import threading
+from typing import Optional
+
+from phi.agent import Agent
+from phi.model.google import Gemini
+
+from agent.research import CachedDuckDuckGo
+
+# Set Google API Key from environment
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+MODEL_ID = "gemini-2.0-flash-exp"
+
+_local = threading.local()
+
+
+def get_medical_agent(
+    api_key: Optional[str] = GOOGLE_API_KEY, model_id: str = MODEL_ID
+) -> Optional[Agent]:
+    """The current thread's agent for a configuration, or None without a key."""
+    if not api_key:
+        return None
+    agents = getattr(_local, "agents", None)
+    if agents is None:
+        agents = _local.agents = {}
+    key = (api_key, model_id)
+    if key not in agents:
+        agents[key] = Agent(
+            model=Gemini(api_key=api_key, id=model_id),
+            tools=[CachedDuckDuckGo()],
+            markdown=True,
+        )
+    return agents[key]
+
+
+def run_medical_agent(prompt: str, images: Optional[list[str]] = None) -> str:
+    """Run the agent on images; blocking, so call it from a worker thread."""
+    agent = get_medical_agent()
+    if agent is None:
+        raise RuntimeError("API Key not configured in environment")
+    # Runs are independent, so nothing is carried over from the previous one.
+    agent.memory.clear()
+    return agent.run(prompt, images=images).content
@@ -0,0 +1,195 @@
+"""Decode and resize uploaded studies in worker processes.
+
+PNG and JPEG images and DICOM files (single or multi-frame, with `pydicom`
+installed) are decoded, windowed to 8 bits where needed, and resized for the
+model to a size that depends on the modality. At most `MAX_FRAMES` frames of a
+multi-frame study are kept, evenly spaced. A thumbnail is made for the
+preview.
+
+The upload itself is never modified. The derived images are stored in a
+directory named after the SHA-256 of the upload's content, so analyzing the
+same study again skips decoding altogether.
+"""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageSequence
+
+# Longest side, in pixels, of the images sent to the model, by DICOM modality.
+MODALITY_SIZES = {
+    "CT": 768,
+    "MR": 768,
+    "CR": 1024,
+    "DX": 1024,
+    "MG": 1536,
+    "US": 640,
+}
+DEFAULT_SIZE = 768
+THUMBNAIL_SIZE = 384
+
+MAX_FRAMES = int(os.getenv("MAX_FRAMES", "8"))
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "2"))
+
+DICOM_SUFFIXES = {".dcm", ".dicom"}
+
+# Pillow modes with more than 8 bits per pixel, e.g. from 16-bit PNGs.
+HIGH_BIT_MODES = {"I", "I;16", "I;16L", "I;16B", "I;16N", "F"}
+
+
+@dataclass
+class PreparedStudy:
+    """The images derived from an upload."""
+
+    digest: str
+    modality: str
+    # Paths of the images to analyze, relative to the cache directory.
+    frames: list[str]
+    thumbnail: str
+    # From the DICOM header, if any.
+    body_part: str = ""
+    description: str = ""
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _first(value) -> float:
+    # Window values may hold one entry per window; the first is the default.
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+
+def _window(pixels, ds):
+    """Map stored values to 8 bits using the file's window, or its range."""
+    import numpy as np
+
+    pixels = pixels.astype(np.float32) * float(ds.get("RescaleSlope", 1) or 1) + float(
+        ds.get("RescaleIntercept", 0) or 0
+    )
+    center, width = ds.get("WindowCenter"), ds.get("WindowWidth")
+    if center is not None and width is not None:
+        low = _first(center) - _first(width) / 2
+        high = _first(center) + _first(width) / 2
+    else:
+        low, high = np.percentile(pixels, (0.5, 99.5))
+    scaled = np.clip((pixels - low) / max(high - low, 1e-6), 0, 1) * 255
+    if ds.get("PhotometricInterpretation") == "MONOCHROME1":
+        scaled = 255 - scaled
+    return scaled.astype(np.uint8)
+
+
+def _decode_dicom(path: str) -> tuple[list[Image.Image], dict[str, str]]:
+    try:
+        import pydicom
+    except ImportError:
+        raise RuntimeError("Install pydicom to analyze DICOM files.") from None
+
+    ds = pydicom.dcmread(path)
+    pixels = ds.pixel_array
+    frames = list(pixels) if int(ds.get("NumberOfFrames", 1) or 1) > 1 else [pixels]
+    color = int(ds.get("SamplesPerPixel", 1) or 1) > 1
+    images = [
+        Image.fromarray(frame.astype("uint8") if color else _window(frame, ds))
+        for frame in frames
+    ]
+    header = {
+        "modality": str(ds.get("Modality", "")),
+        "body_part": str(ds.get("BodyPartExamined", "")),
+        "description": str(ds.get("StudyDescription", "")),
+    }
+    return images, header
+
+
+def _to_rgb(frame: Image.Image) -> Image.Image:
+    import numpy as np
+
+    if frame.mode in HIGH_BIT_MODES:
+        # Converted directly, every value above 255 saturates to white; they are
+        # windowed like a DICOM without a window instead.
+        frame = Image.fromarray(_window(np.asarray(frame), {}))
+    return frame.convert("RGB")
+
+
+def _decode_image(path: str) -> list[Image.Image]:
+    with Image.open(path) as img:
+        return [_to_rgb(frame) for frame in ImageSequence.Iterator(img)]
+
+
+def _sample(frames: list, count: int) -> list:
+    if len(frames) <= count:
+        return frames
+    step = (len(frames) - 1) / (count - 1) if count > 1 else 0
+    return [frames[round(i * step)] for i in range(count)]
+
+
+def prepare(path: str, cache_dir: str) -> PreparedStudy:
+    """Decode an upload into resized frames and a thumbnail, or reuse them."""
+    digest = content_hash(path)
+    out = Path(cache_dir) / digest
+    manifest = out / "manifest.json"
+    if manifest.exists():
+        return PreparedStudy(**json.loads(manifest.read_text()))
+
+    if Path(path).suffix.lower() in DICOM_SUFFIXES:
+        frames, header = _decode_dicom(path)
+    else:
+        frames, header = _decode_image(path), {"modality": ""}
+    frames = _sample(frames, MAX_FRAMES)
+    size = MODALITY_SIZES.get(header["modality"], DEFAULT_SIZE)
+
+    out.mkdir(parents=True, exist_ok=True)
+    names = []
+    for i, frame in enumerate(frames):
+        frame = frame.copy()
+        frame.thumbnail((size, size))
+        names.append(f"{digest}/frame-{i:03d}.png")
+        frame.save(Path(cache_dir) / names[-1])
+    thumbnail = frames[len(frames) // 2].copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    thumbnail.save(out / "thumbnail.png")
+
+    study = PreparedStudy(
+        digest=digest,
+        frames=names,
+        thumbnail=f"{digest}/thumbnail.png",
+        **header,
+    )
+    # Written last, and atomically, so a manifest always has its images.
+    tmp = manifest.with_suffix(".tmp")
+    tmp.write_text(json.dumps(asdict(study)))
+    tmp.replace(manifest)
+    return study
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=PREPROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def prepare_async(path: str, cache_dir: str) -> PreparedStudy:
+    """Prepare an upload in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), prepare, path, cache_dir)
@@ -0,0 +1,186 @@
+"""DuckDuckGo searches, cached across analyses and prefetched.
+
+The agent researches every case on the web, and common findings lead to the
+same searches over and over. Results are cached in a SQLite database at
+`SEARCH_CACHE_PATH`, keyed by the normalized query, for `SEARCH_CACHE_TTL`
+seconds. Concurrent searches for the same query share a single request.
+
+When the subject of a study is known before the analysis, from the modality
+and body part in its DICOM header, the research searches are started in
+parallel with the image analysis, and the agent is asked to run those same
+searches, which then come from the cache instead of the web.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from phi.tools.duckduckgo import DuckDuckGo
+
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.db")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# How long a search waits for the same search already in flight.
+PENDING_TIMEOUT = 60
+
+MODALITY_NAMES = {
+    "CT": "CT",
+    "MR": "MRI",
+    "CR": "X-ray",
+    "DX": "X-ray",
+    "MG": "mammography",
+    "US": "ultrasound",
+    "PT": "PET",
+    "NM": "nuclear medicine",
+}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", query.lower()))
+
+
+class SearchCache:
+    """Search results in SQLite, with expiry and one request per query."""
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl: float = SEARCH_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pending: dict[str, threading.Event] = {}
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches "
+                "(key TEXT PRIMARY KEY, results TEXT NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM searches WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            row = conn.execute(
+                "SELECT results FROM searches WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, results: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                (key, results, time.time()),
+            )
+
+    def fetch(self, key: str, search: Callable[[], str]) -> str:
+        """The cached results for a key, or those of `search`, which are cached."""
+        while True:
+            results = self.get(key)
+            if results is not None:
+                return results
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another thread is running this search; if it fails, try ourselves.
+            pending.wait(PENDING_TIMEOUT)
+
+        try:
+            results = search()
+            self.put(key, results)
+            return results
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+
+search_cache = SearchCache()
+
+
+class CachedDuckDuckGo(DuckDuckGo):
+    """The DuckDuckGo toolkit, with its results served from `search_cache`."""
+
+    def duckduckgo_search(self, query: str, max_results: int = 5) -> str:
+        """Use this function to search DuckDuckGo for a query.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The result from DuckDuckGo.
+        """
+        return search_cache.fetch(
+            f"search:{max_results}:{normalize_query(query)}",
+            lambda: DuckDuckGo.duckduckgo_search(self, query, max_results),
+        )
+
+    def duckduckgo_news(self, query: str, max_results: int = 5) -> str:
+        """Use this function to get the latest news from DuckDuckGo.
+
+        Args:
+            query(str): The query to search for.
+            max_results (optional, default=5): The maximum number of results to return.
+
+        Returns:
+            The latest news from DuckDuckGo.
+        """
+        return search_cache.fetch(
+            f"news:{max_results}:{normalize_query(query)}",
+            lambda: DuckDuckGo.duckduckgo_news(self, query, max_results),
+        )
+
+
+def study_subject(modality: str, body_part: str) -> str:
+    """What a study shows, from its DICOM header, e.g. "CT chest".
+
+    Only coded fields are used: free-text ones like StudyDescription may hold
+    patient details, which must not end up in web searches.
+    """
+    if not modality and not body_part:
+        return ""
+    return " ".join(
+        part
+        for part in (MODALITY_NAMES.get(modality, modality), body_part.lower())
+        if part
+    )
+
+
+def research_queries(subject: str) -> list[str]:
+    """The searches of the report's research section, for a subject."""
+    if not subject:
+        return []
+    return [
+        f"{subject} imaging findings recent literature",
+        f"{subject} standard treatment protocols",
+        f"{subject} imaging technological advances",
+    ]
+
+
+def with_research(prompt: str, queries: list[str]) -> str:
+    """The prompt, asking the agent to run the given searches for its research."""
+    if not queries:
+        return prompt
+    searches = "\n".join(f"- {query}" for query in queries)
+    return (
+        f"{prompt}\n"
+        "For the research context, run these DuckDuckGo searches first, with "
+        f"exactly these queries, before searching for anything else:\n{searches}\n"
+    )
+
+
+async def prefetch(queries: list[str]) -> None:
+    """Run searches into the cache; failures are left to the agent's own search."""
+    tool = CachedDuckDuckGo()
+    await asyncio.gather(
+        *(asyncio.to_thread(tool.duckduckgo_search, query) for query in queries),
+        return_exceptions=True,
+    )
@@ -0,0 +1,145 @@
+"""A cache of Gemini replies, shared by every user.
+
+Users with the same profile selections tend to ask the same questions, so
+replies are cached under a canonical form of the profile, the previous turns
+of the conversation and the normalized prompt. Entries expire after
+`RESPONSE_CACHE_TTL` seconds, and only the `RESPONSE_CACHE_SIZE` most
+recently used are kept in memory. If `RESPONSE_CACHE_PATH` is set, entries
+are also stored in a SQLite database there, so they survive restarts.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .options import PROFILE_OPTIONS
+
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")
+
+# Physical stats are rounded to these steps (in cm, kg and years), so nearby
+# values share entries.
+STAT_STEPS = {"height": 5, "weight": 5, "age": 5}
+TO_METRIC = {"ft": 30.48, "lbs": 0.4536}
+
+
+def normalize_prompt(prompt: str) -> str:
+    words = re.findall(r"[a-z0-9]+(?:['-][a-z0-9]+)*", prompt.lower())
+    return " ".join(words)
+
+
+def _stat(value: str, step: int):
+    match = re.match(r"\s*(\d+(?:\.\d+)?)\s*([a-z]*)", value.lower())
+    if not match:
+        return value.strip().lower()
+    number = float(match.group(1)) * TO_METRIC.get(match.group(2), 1)
+    return round(number / step) * step
+
+
+def profile_vector(profile: dict[str, str]) -> tuple:
+    """The profile as option indexes and rounded metric stats."""
+    options = tuple(
+        values.index(profile[field]) if profile.get(field) in values else -1
+        for field, values in PROFILE_OPTIONS.items()
+    )
+    stats = tuple(
+        _stat(profile.get(stat, ""), step) for stat, step in STAT_STEPS.items()
+    )
+    return options + stats
+
+
+def cache_key(vector: tuple, history: list[dict[str, str]], prompt: str) -> str:
+    """The key of a prompt, given the profile vector and the conversation so far."""
+    payload = json.dumps(
+        [
+            vector,
+            [normalize_prompt(m["message"]) for m in history],
+            normalize_prompt(prompt),
+        ]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """A size-bounded LRU cache with expiry, optionally backed by SQLite."""
+
+    def __init__(
+        self,
+        ttl: float = TTL,
+        max_entries: int = MAX_ENTRIES,
+        path: Optional[str] = CACHE_PATH,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                    "created_at REAL NOT NULL)"
+                )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _load(self, key: str) -> Optional[tuple[str, float]]:
+        if not self.path:
+            return None
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+        with self._lock:
+            if entry is None or time.time() - entry[1] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            return entry[0]
+
+    def _remember(self, key: str, entry: tuple[str, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, response: str) -> None:
+        entry = (response, time.time())
+        with self._lock:
+            self._remember(key, entry)
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, *entry)
+                )
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,32 @@
+L1 = ["sedentary", "active", "moderately active", "very active", "super active"]
+L2 = [f"{i + 1} day per week" + ("s" if i > 0 else "") for i in range(7)]
+L3 = ["light", "moderate", "intense"]
+L4 = [f"{i + 1} hour per night" + ("s" if i > 0 else "") for i in range(9)]
+
+H1 = ["weight loss", "muscle gain", "maintenance"]
+H2 = [f"{i} month" + ("s" if i > 1 else "") for i in [1, 3, 6, 12]]
+
+D1 = [
+    "vegetarian",
+    "vegan",
+    "gluten-free",
+    "paleo",
+    "ketogenic",
+    "low-carb",
+    "dairy-free",
+    "none",
+]
+
+D2 = ["nuts", "shellfish", "dairy", "gluten", "soy", "eggs", "wheat", "none"]
+
+# The options of every profile field chosen from a list.
+PROFILE_OPTIONS = {
+    "Occupation Type": L1,
+    "Exercise Frequency": L2,
+    "Exercise Intensity": L3,
+    "Sleep Pattern": L4,
+    "Primary Goal": H1,
+    "Timeframe": H2,
+    "Dietary Restrictions": D1,
+    "Food Allergies": D2,
+}
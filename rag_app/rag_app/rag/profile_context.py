@@ -0,0 +1,26 @@
+from dataclasses import dataclass, field
+
+from .cache import profile_vector
+from .sessions import profile_instruction
+
+
+@dataclass
+class ProfileContext:
+    """The user's profile, and what the chat derives from it.
+
+    The system instruction and the cache vector are recomputed when the
+    profile changes, instead of on every message or state update.
+    """
+
+    profile: dict[str, str] = field(default_factory=dict)
+    instruction: str = field(default_factory=lambda: profile_instruction({}))
+    vector: tuple = field(default_factory=lambda: profile_vector({}))
+
+    def update(self, profile: dict[str, str]) -> bool:
+        """Replace the profile, returning whether it changed."""
+        if profile == self.profile:
+            return False
+        self.profile = dict(profile)
+        self.instruction = profile_instruction(self.profile)
+        self.vector = profile_vector(self.profile)
+        return True
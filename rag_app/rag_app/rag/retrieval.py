@@ -0,0 +1,207 @@
+"""Retrieval over the bundled nutrition and exercise notes.
+
+The notes in `corpus/nutrition.jsonl` are split into passages and embedded
+once, on first use, into a flat in-memory index (one normalized vector per
+passage, searched with a single matrix product). Passages that don't fit the
+user's dietary restriction, or that contain one of their allergens, are
+filtered out before ranking, so only a few relevant passages go into the
+prompt.
+
+Embeddings come from `sentence-transformers` if it is installed, and from a
+hashed TF-IDF of words and word pairs otherwise, which needs only numpy.
+"""
+
+import functools
+import json
+import math
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+CORPUS_PATH = Path(__file__).parent / "corpus" / "nutrition.jsonl"
+
+# Passages are at most this many words long.
+PASSAGE_WORDS = 80
+
+TOP_K = 3
+
+HASH_DIM = 2**15
+
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# The profile value meaning "no restriction" or "no allergy".
+NONE = "none"
+
+
+@dataclass(frozen=True)
+class Passage:
+    title: str
+    text: str
+    topic: str
+    # The dietary restrictions the passage fits, and the allergens it mentions.
+    diets: frozenset[str]
+    contains: frozenset[str]
+
+    def allowed(self, restriction: Optional[str], allergy: Optional[str]) -> bool:
+        if restriction and restriction != NONE and restriction not in self.diets:
+            return False
+        return not (allergy and allergy != NONE and allergy in self.contains)
+
+
+def load_passages(path: Path = CORPUS_PATH) -> list[Passage]:
+    passages = []
+    with open(path) as f:
+        for line in f:
+            doc = json.loads(line)
+            words = doc["text"].split()
+            for start in range(0, len(words), PASSAGE_WORDS):
+                passages.append(
+                    Passage(
+                        title=doc["title"],
+                        text=" ".join(words[start : start + PASSAGE_WORDS]),
+                        topic=doc["topic"],
+                        diets=frozenset(doc["diets"]),
+                        contains=frozenset(doc["contains"]),
+                    )
+                )
+    return passages
+
+
+STOP_WORDS = frozenset(
+    "a about an and are as at be by can do does for from get give how i in is it "
+    "me much many my need of on or should some the to what when which with you "
+    "your".split()
+)
+
+
+def stem(word: str) -> str:
+    """Strip plural endings, so "carbohydrates" matches "carbohydrate"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> list[str]:
+    words = [
+        stem(w) for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS
+    ]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class HashingEmbedder:
+    """TF-IDF vectors of hashed words and word pairs."""
+
+    # Passages scoring below this are left out, even if fewer than k remain.
+    min_score = 0.02
+
+    def __init__(self, corpus: list[str], dim: int = HASH_DIM):
+        self.dim = dim
+        df = np.zeros(dim)
+        for text in corpus:
+            df[list({self._bucket(t) for t in terms(text)})] += 1
+        self.idf = np.log((1 + len(corpus)) / (1 + df)) + 1
+
+    def _bucket(self, term: str) -> int:
+        # crc32 rather than hash(), which differs between processes.
+        return zlib.crc32(term.encode()) % self.dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: dict[int, int] = {}
+            for term in terms(text):
+                bucket = self._bucket(term)
+                counts[bucket] = counts.get(bucket, 0) + 1
+            for bucket, count in counts.items():
+                vectors[row, bucket] = (1 + math.log(count)) * self.idf[bucket]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceEmbedder:
+    """Embeddings from a sentence-transformers model, on the CPU."""
+
+    min_score = 0.3
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+
+class PassageIndex:
+    """A flat index of passage embeddings, filtered by the user's diet."""
+
+    def __init__(self, passages: list[Passage], embedder):
+        self.passages = passages
+        self.embedder = embedder
+        self.vectors = embedder.embed([f"{p.title}. {p.text}" for p in passages])
+        # The passages allowed by each (restriction, allergy) pair; there are
+        # only as many pairs as the profile form offers.
+        self._masks: dict[tuple[Optional[str], Optional[str]], np.ndarray] = {}
+
+    def _mask(self, restriction: Optional[str], allergy: Optional[str]) -> np.ndarray:
+        key = (restriction, allergy)
+        if key not in self._masks:
+            self._masks[key] = np.array(
+                [p.allowed(restriction, allergy) for p in self.passages]
+            )
+        return self._masks[key]
+
+    def search(
+        self,
+        query: str,
+        restriction: Optional[str] = None,
+        allergy: Optional[str] = None,
+        k: int = TOP_K,
+    ) -> list[Passage]:
+        """The passages most similar to the query that fit the user's diet."""
+        scores = self.vectors @ self.embedder.embed([query])[0]
+        scores[~self._mask(restriction, allergy)] = -np.inf
+        top = np.argsort(-scores)[:k]
+        return [self.passages[i] for i in top if scores[i] >= self.embedder.min_score]
+
+
+def create_embedder(passages: list[Passage]):
+    try:
+        return SentenceEmbedder()
+    except Exception:
+        # Not installed, or the model can't be loaded (e.g. offline).
+        return HashingEmbedder([f"{p.title}. {p.text}" for p in passages])
+
+
+@functools.cache
+def get_index() -> PassageIndex:
+    """The index of the bundled corpus, built on first use."""
+    passages = load_passages()
+    return PassageIndex(passages, create_embedder(passages))
+
+
+def retrieve(
+    query: str, restriction: Optional[str] = None, allergy: Optional[str] = None
+) -> list[Passage]:
+    """Search the bundled corpus, building its index on the first call."""
+    return get_index().search(query, restriction, allergy)
+
+
+def with_context(prompt: str, passages: list[Passage]) -> str:
+    """The prompt, preceded by the passages retrieved for it."""
+    if not passages:
+        return prompt
+    notes = "\n".join(f"- {p.title}: {p.text}" for p in passages)
+    return (
+        f"Use these reference notes where they are relevant:\n{notes}\n\n"
+        f"Question: {prompt}"
+    )
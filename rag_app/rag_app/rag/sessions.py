@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import google.generativeai as genai
+
+# Question/answer turns kept in a chat's history, and so resent with every
+# message.
+MAX_HISTORY_TURNS = 6
+
+# Chats unused for this many seconds are dropped.
+IDLE_TIMEOUT = 30 * 60
+
+MAX_SESSIONS = 1000
+
+
+def profile_instruction(profile: dict[str, str]) -> str:
+    details = "\n".join(f"- {key}: {value}" for key, value in profile.items())
+    return (
+        "You are a nutrition and fitness assistant. Take into account the "
+        f"following details about the user when generating your answer:\n{details}"
+    )
+
+
+def add_turn(chat: genai.ChatSession, message: str, reply: str) -> None:
+    """Add a turn answered without the model, e.g. from the cache, to a chat."""
+    chat.history = chat.history + [
+        {"role": "user", "parts": [message]},
+        {"role": "model", "parts": [reply]},
+    ]
+
+
+@dataclass
+class _Entry:
+    chat: genai.ChatSession
+    instruction: str
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ChatSessionPool:
+    """A Gemini chat per browser session, with the user's profile as instruction.
+
+    Each chat keeps at most `MAX_HISTORY_TURNS` turns of history. Chats are
+    dropped after `IDLE_TIMEOUT` seconds without use, or when the pool holds
+    more than `MAX_SESSIONS`, least recently used first.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        generation_config: dict,
+        max_turns: int = MAX_HISTORY_TURNS,
+        idle_timeout: float = IDLE_TIMEOUT,
+        max_sessions: int = MAX_SESSIONS,
+    ):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.max_turns = max_turns
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            token, entry = next(iter(self._entries.items()))
+            if (
+                len(self._entries) <= self.max_sessions
+                and now - entry.last_used < self.idle_timeout
+            ):
+                break
+            del self._entries[token]
+
+    def get(self, token: str, instruction: str) -> genai.ChatSession:
+        """The chat of a session, with its history trimmed for the next message."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry.instruction != instruction:
+                # The system instruction belongs to the model, so a changed
+                # profile needs a new model; the conversation carries over.
+                model = genai.GenerativeModel(
+                    model_name=self.model_name,
+                    generation_config=self.generation_config,
+                    system_instruction=instruction,
+                )
+                history = entry.chat.history if entry else []
+                entry = _Entry(
+                    chat=model.start_chat(history=history), instruction=instruction
+                )
+                self._entries[token] = entry
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(token)
+            self._evict()
+
+            # The history holds a user and a model message per turn.
+            if len(entry.chat.history) > 2 * self.max_turns:
+                entry.chat.history = entry.chat.history[-2 * self.max_turns :]
+            return entry.chat
+
+    def drop(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
@@ -51,6 +51,8 @@ def chat_area() -> rx.vstack:
     return rx.vstack(
         rx.badge(
             rx.text("Using Google's gemini-1.5-flash model.", size="1", weight="bold"),
+            rx.spacer(),
+            rx.text(f"Cache hit rate: {State.cache_hit_rate}", size="1"),
             **ChatAreaStyle.model_tag,
         ),
         chat_box(),
@@ -1,5 +1,6 @@
 import reflex as rx
 
+from ..options import D1, D2, H1, H2, L1, L2, L3, L4
 from ..shared.profile_components import (
     profile_item_activity_stats,
     profile_item_physical_stats,
@@ -20,11 +21,6 @@ physical_stats = rx.hstack(
     grid_template_columns=[f"repeat({i}, minmax(0, 1fr))" for i in [1, 1, 1, 3, 3, 3]],
 )
 
-L1 = ["sedentary", "active", "moderately active", "very active", "super active"]
-L2 = [f"{i + 1} day per week" + ("s" if i > 0 else "") for i in range(7)]
-L3 = ["light", "moderate", "intense"]
-L4 = [f"{i + 1} hour per night" + ("s" if i > 0 else "") for i in range(9)]
-
 activity_stats = rx.vstack(
     rx.hstack(
         profile_item_activity_stats("Occupation Type", L1),
@@ -41,10 +37,6 @@ activity_stats = rx.vstack(
 )
 
 
-H1 = ["weight loss", "muscle gain", "maintenance"]
-H2 = [f"{i} month" + ("s" if i > 1 else "") for i in [1, 3, 6, 12]]
-
-
 health_goals = rx.vstack(
     rx.hstack(
         profile_item_activity_stats("Primary Goal", H1),
@@ -55,20 +47,6 @@ health_goals = rx.vstack(
     gap=["12px" if i <= 3 else "32px" for i in range(6)],
 )
 
-D1 = [
-    "vegetarian",
-    "vegan",
-    "gluten-free",
-    "paleo",
-    "ketogenic",
-    "low-carb",
-    "dairy-free",
-    "none",
-]
-
-D2 = ["nuts", "shellfish", "dairy", "gluten", "soy", "eggs", "wheat", "none"]
-
-
 diet_restrictions = rx.vstack(
     rx.hstack(
         profile_item_activity_stats("Dietary Restrictions", D1),
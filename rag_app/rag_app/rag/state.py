@@ -4,6 +4,12 @@ import os
 import google.generativeai as genai
 import reflex as rx
 
+from .cache import cache_key, response_cache
+from .profile_context import ProfileContext
+from .retrieval import retrieve, with_context
+from .sessions import ChatSessionPool, add_turn
+from .streaming import IncompleteReply, stream_reply
+
 key = os.getenv("KEY")
 genai.configure(api_key=key)
 
@@ -11,16 +17,13 @@ generation_config = {
     "temperature": 1,
     "top_p": 0.95,
     "top_k": 64,
-    "max_output_tokens": 250,
+    # Room for long answers such as meal plans; shorter ones stop on their own.
+    "max_output_tokens": 2048,
     "response_mime_type": "text/plain",
 }
 
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config=generation_config,
-)
-
-chat_session = model.start_chat()
+# Every browser session gets its own chat, so users don't share a history.
+chat_sessions = ChatSessionPool("gemini-1.5-flash", generation_config)
 
 
 class State(rx.State):
@@ -42,60 +45,96 @@ class State(rx.State):
     chat_history: list[dict[str, str]]
     # ... other chat vars
     is_generating: bool = False
+    # ... share of prompts answered from the response cache
+    cache_hit_rate: str = "0%"
+
+    # ... profile as used by the chat, updated only when the profile changes
+    _profile: ProfileContext | None = None
+
+    def _update_profile(self) -> None:
+        context = self._profile or ProfileContext()
+        if context.update(self.data) or self._profile is None:
+            self._profile = context
 
     async def set_units(self, unit: str) -> None:
         self.selected_unit = unit
+        if "height" in self.data:
+            self._set_physical_stats()
+            self._update_profile()
 
-    async def set_profile_stats(self, info: list[str]) -> None:
+    def _set_physical_stats(self) -> None:
         self.data["height"], self.data["weight"], self.data["age"] = (
             self.height + self.units[self.selected_unit]["height"],
             self.weight + self.units[self.selected_unit]["weight"],
             self.age + "years",
         )
 
+    async def set_profile_stats(self, info: list[str]) -> None:
+        self._set_physical_stats()
         self.data[info[0]] = info[1]
+        self._update_profile()
 
     async def check_form_if_complete(self) -> bool:
         return len(self.data) == 8
 
-    @rx.var
+    @rx.var(cache=True)
     def track_profil_stat_changes(self) -> dict[str, str]:
-        if chat_session.history:
-            chat_session.history.pop(0)
-
-        chat_session.history.insert(
-            0,
-            {
-                "role": "user",
-                "parts": [
-                    f"Take into account the following details when generating your answer {self.data}",
-                ],
-            },
-        )
-
         return self.data
 
+    @rx.event(background=True)
     async def send_prompt(self):
-        if self.prompt:
+        async with self:
+            if not self.prompt or self.is_generating:
+                return
+            prompt = self.prompt
+            restriction = self.data.get("Dietary Restrictions")
+            allergy = self.data.get("Food Allergies")
+            # ... only does work if the profile changed since it was last used
+            self._update_profile()
+            key = cache_key(self._profile.vector, self.chat_history, prompt)
+            chat = chat_sessions.get(
+                self.router.session.client_token, self._profile.instruction
+            )
+            history = chat.history
+            self.prompt = ""
             self.is_generating = True
-
-            yield
-            self.chat_history.append({"role": "user", "message": self.prompt})
-            yield
+            self.chat_history.append({"role": "user", "message": prompt})
             self.chat_history.append({"role": "gemini-1.5-flash", "message": ""})
 
-            response = await self.send_message_to_chat(self.prompt)
-
-            for word in response.split():
-                for char in list(word):
-                    self.chat_history[-1]["message"] += char
-                    await asyncio.sleep(0.009)
-                self.chat_history[-1]["message"] += " "
-                yield
-
-            self.prompt = ""
-            self.is_generating = False
-
-    async def send_message_to_chat(self, message):
-        response = chat_session.send_message(message)
-        return response.text
+        try:
+            # A cached reply is shown at once, and added to the chat's history as
+            # if the model had given it.
+            reply = await asyncio.to_thread(response_cache.get, key)
+            if reply is not None:
+                add_turn(chat, prompt, reply)
+                async with self:
+                    self.chat_history[-1]["message"] = reply
+                return
+
+            # Ground the answer in the notes that fit the user's diet.
+            passages = await asyncio.to_thread(retrieve, prompt, restriction, allergy)
+            reply = ""
+            try:
+                async for words in stream_reply(chat, with_context(prompt, passages)):
+                    reply += words
+                    async with self:
+                        self.chat_history[-1]["message"] += words
+            except IncompleteReply as e:
+                if e.reason != "MAX_TOKENS":
+                    raise
+                # Shown as far as it got, like any long answer, but not cached.
+                reply = ""
+            # Only complete replies are cached: failed streams raise.
+            if reply.strip():
+                await asyncio.to_thread(response_cache.put, key, reply)
+        except Exception as e:
+            # A blocked or broken stream leaves the chat unusable (its history
+            # raises BrokenResponseError); setting the history resets it to
+            # before this prompt.
+            chat.history = history
+            async with self:
+                self.chat_history[-1]["message"] += f"Error: {e}"
+        finally:
+            async with self:
+                self.is_generating = False
+                self.cache_hit_rate = f"{response_cache.hit_rate:.0%}"
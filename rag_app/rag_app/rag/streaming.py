@@ -0,0 +1,43 @@
+import asyncio
+from typing import AsyncIterator
+
+
+class IncompleteReply(RuntimeError):
+    """A reply the model stopped generating before it was finished."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"The reply was cut off ({reason}).")
+        # The Gemini finish reason, e.g. "SAFETY" or "MAX_TOKENS".
+        self.reason = reason
+
+
+def split_words(text: str) -> tuple[str, str]:
+    """Split text after its last whitespace, into whole words and the rest."""
+    cut = max(text.rfind(" "), text.rfind("\n")) + 1
+    return text[:cut], text[cut:]
+
+
+async def stream_reply(chat_session, message: str) -> AsyncIterator[str]:
+    """Send a message to a Gemini chat and yield the reply as it is generated.
+
+    The Gemini client is synchronous, so the request and every chunk are
+    read in a worker thread to keep the event loop free. Chunks are passed on
+    whole words at a time, so the reply grows word by word.
+
+    Once the reply is yielded, raises `IncompleteReply` if the model stopped
+    for any reason other than having finished it, e.g. a safety block or the
+    token limit.
+    """
+    response = await asyncio.to_thread(chat_session.send_message, message, stream=True)
+    chunks = iter(response)
+    pending = ""
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        words, pending = split_words(pending + chunk.text)
+        if words:
+            yield words
+    if pending:
+        yield pending
+    candidates = response.candidates
+    reason = candidates[0].finish_reason.name if candidates else "BLOCKED"
+    if reason != "STOP":
+        raise IncompleteReply(reason)